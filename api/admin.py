@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Post, Album
+from .models import Post, Album, Tombstone
 
 # Register your models here.
 
@@ -22,5 +22,11 @@ class AlbumAdmin(admin.ModelAdmin):
                     'created',
                     'reference')
 
+class TombstoneAdmin(admin.ModelAdmin):
+    list_display = ('kind',
+                    'object_id',
+                    'deleted')
+
 admin.site.register(Post, PostAdmin)
-admin.site.register(Album, AlbumAdmin)
\ No newline at end of file
+admin.site.register(Album, AlbumAdmin)
+admin.site.register(Tombstone, TombstoneAdmin)
\ No newline at end of file
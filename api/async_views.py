@@ -0,0 +1,148 @@
+"""
+Coroutine versions of the read endpoints, routed in place of their api/views.py
+counterparts when the project is served over ASGI (see ASYNC_VIEWS).
+
+GET requests run on the event loop with the async ORM. Writes are rare and
+keep going through the sync views in a worker thread.
+"""
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.paginator import Paginator
+from django.db.models import Max
+
+from . import views
+from .cache import cache_response, conditional_response
+from .export import aexport_chunks
+from .models import Post, Album, Tombstone
+from .responses import JsonResponse
+
+
+def list_validator(model, kind):
+    async def validator(request):
+        updated = (await model.objects.aaggregate(updated=Max('updated')))["updated"]
+        deleted = (await Tombstone.objects.filter(kind=kind).aaggregate(deleted=Max('deleted')))["deleted"]
+        return views.list_etag(request, updated, deleted)
+    return validator
+
+
+def detail_validator(model, lookup):
+    async def validator(request, **kwargs):
+        updated = await model.objects.filter(id=kwargs[lookup]).values_list('updated', flat=True).afirst()
+        return views.detail_etag(request, updated)
+    return validator
+
+
+async def album_validator(request, album_id):
+    updated = await Album.objects.filter(id=album_id).values_list('updated', flat=True).afirst()
+    if updated is None or not views.include_posts_or_error(request):
+        return views.detail_etag(request, updated)
+    posts_updated = (await Post.objects.aaggregate(updated=Max('updated')))["updated"]
+    deleted = (await Tombstone.objects.filter(kind=Tombstone.POST).aaggregate(deleted=Max('deleted')))["deleted"]
+    return views.album_posts_etag(request, updated, posts_updated, deleted)
+
+
+async def handle_page(request, objects, count=None):
+    page, size = views.get_page_params(request)
+    if 'cursor' in request.GET:
+        cursor = request.GET.get('cursor')
+        objects, direction, size = views.cursor_queryset(cursor, objects, size)
+        return views.create_cursor_page([obj async for obj in objects], cursor, direction, size)
+    paginator = Paginator(objects, size)
+    # Paginator.count is a cached_property; filling it in keeps get_page()
+    # from running the COUNT(*) synchronously.
+    paginator.count = await objects.acount() if count is None else count
+    page_obj = paginator.get_page(page)
+    return [obj async for obj in page_obj.object_list], views.create_page_response(page_obj, size)
+
+
+@cache_response
+@conditional_response(list_validator(Album, Tombstone.ALBUM))
+async def handle_album(request):
+    if request.method != "GET":
+        return await sync_to_async(views.handle_album)(request)
+    try:
+        all_albums, serialize = views.handle_album_fields(request, views.handle_album_search(request))
+        albums, page = await handle_page(request, all_albums)
+        response = {"page": page, "albums": [serialize(album) for album in albums]}
+        return JsonResponse(response, status=200)
+    except ValueError as e:
+        return JsonResponse({"message":str(e)}, status=400)
+
+
+@cache_response
+@conditional_response(album_validator)
+async def handle_album_by_id(request, album_id):
+    if request.method != "GET":
+        return await sync_to_async(views.handle_album_by_id)(request, album_id)
+    return await get_album(request, album_id)
+
+
+async def get_album(request, album_id):
+    try:
+        album = await views.album_queryset().aget(id=album_id)
+        response = views.create_album_response(album)
+        if views.include_posts(request):
+            posts, serialize = views.handle_post_fields(request, views.album_posts_queryset(album_id))
+            post_count = await posts.acount()
+            posts, page = await handle_page(request, posts, post_count)
+            response["postCount"] = post_count
+            response["page"] = page
+            response["posts"] = [serialize(post) for post in posts]
+        return JsonResponse(response, status=200)
+    except ObjectDoesNotExist:
+        return JsonResponse({}, status=200)
+    except ValueError as e:
+        return JsonResponse({"message":str(e)}, status=400)
+
+
+@cache_response
+@conditional_response(list_validator(Post, Tombstone.POST))
+async def handle_post(request):
+    if request.method != "GET":
+        return await sync_to_async(views.handle_post)(request)
+    if 'ids' in request.GET:
+        return await get_posts_by_ids(request)
+    try:
+        all_posts, serialize = views.handle_post_fields(request, views.handle_post_search(request))
+        posts, page = await handle_page(request, all_posts)
+        response = {"page": page, "posts": [serialize(post) for post in posts]}
+        return JsonResponse(response, status=200)
+    except ValueError as e:
+        return JsonResponse({"message":str(e)}, status=400)
+
+
+async def get_posts_by_ids(request):
+    try:
+        ids = views.parse_ids(request.GET.get('ids'))
+        objects, serialize = views.handle_post_fields(request, views.post_queryset())
+    except ValueError as e:
+        return JsonResponse({"message":str(e)}, status=400)
+    posts = await objects.ain_bulk(ids)
+    return JsonResponse(views.create_posts_by_ids_response(ids, posts, serialize), status=200)
+
+
+@cache_response
+@conditional_response(detail_validator(Post, 'post_id'))
+async def handle_post_by_id(request, post_id):
+    if request.method != "GET":
+        return await sync_to_async(views.handle_post_by_id)(request, post_id)
+    return await get_post(request, post_id)
+
+
+async def get_post(request, post_id):
+    try:
+        post = await views.post_queryset().aget(id=post_id)
+        return JsonResponse(views.create_post_response(post))
+    except ObjectDoesNotExist:
+        return JsonResponse({}, status=200)
+
+
+async def handle_export(request):
+    # A sync iterator would be read into memory in full before an ASGI
+    # response could send it.
+    if request.method != "GET":
+        return JsonResponse({"message":"method not allowed"}, status=405)
+    if not await sync_to_async(views.check_staff)(request):
+        return JsonResponse({"message":views.NOT_AUTH}, status=401)
+    return views.create_export_response(aexport_chunks())
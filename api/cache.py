@@ -0,0 +1,171 @@
+"""
+Versioned response cache and conditional GET support for the public read
+endpoints.
+
+Cached responses are keyed on a generation counter that the signal handlers
+in api/signals.py bump on every Post/Album save or delete. A write therefore
+never has to find and delete stale entries: it moves every reader to a new
+set of keys and the old entries simply expire.
+
+Cached entries keep the ETag and Last-Modified headers of the response, so
+conditional requests that hit the cache are answered without the database.
+
+Both decorators accept sync views and the coroutine views in api/async_views.py;
+an async view needs an async validator.
+"""
+
+from functools import wraps
+import asyncio
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag, urlencode
+
+GENERATION_KEY = "api:generation"
+CACHED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+
+def get_cache():
+    return caches[settings.API_CACHE_ALIAS]
+
+
+def new_generation():
+    # Seeded from the clock so that a counter lost to a cache restart or cull
+    # never restarts below a generation that still has entries cached.
+    return int(time.time() * 1000000)
+
+
+def get_generation(cache):
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, new_generation(), None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+async def aget_generation(cache):
+    generation = await cache.aget(GENERATION_KEY)
+    if generation is None:
+        await cache.aadd(GENERATION_KEY, new_generation(), None)
+        generation = await cache.aget(GENERATION_KEY)
+    return generation
+
+
+def bump_generation():
+    cache = get_cache()
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, new_generation(), None)
+
+
+def response_cache_key(request, generation):
+    query = urlencode(sorted((key, sorted(values)) for key, values in request.GET.lists()), doseq=True)
+    digest = hashlib.md5(("%s?%s" % (request.path, query)).encode()).hexdigest()
+    return "api:response:%s:%s" % (generation, digest)
+
+
+def cached_response(request, cached):
+    content, headers = cached
+    response = HttpResponse(content)
+    for header, value in headers.items():
+        response[header] = value
+    return get_conditional_response(request,
+                                    etag=response.get('ETag'),
+                                    last_modified=parse_http_date_safe(response.get('Last-Modified', '')),
+                                    response=response)
+
+
+def cache_entry(response):
+    headers = {header: response[header] for header in CACHED_HEADERS if response.has_header(header)}
+    return response.content, headers
+
+
+def cache_response(view):
+    if asyncio.iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            if request.method != "GET":
+                return await view(request, *args, **kwargs)
+            # The file backend reads and writes disk, so its calls must not
+            # block the event loop.
+            cache = get_cache()
+            key = response_cache_key(request, await aget_generation(cache))
+            cached = await cache.aget(key)
+            if cached is not None:
+                return cached_response(request, cached)
+            response = await view(request, *args, **kwargs)
+            if response.status_code == 200:
+                await cache.aset(key, cache_entry(response))
+            return response
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method != "GET":
+            return view(request, *args, **kwargs)
+        cache = get_cache()
+        key = response_cache_key(request, get_generation(cache))
+        cached = cache.get(key)
+        if cached is not None:
+            return cached_response(request, cached)
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, cache_entry(response))
+        return response
+    return wrapper
+
+
+def make_etag(*parts):
+    return quote_etag(hashlib.md5(":".join(str(part) for part in parts).encode()).hexdigest())
+
+
+def conditional_response(validator):
+    """
+    Answer If-None-Match/If-Modified-Since before the view runs.
+
+    validator(request, *args, **kwargs) returns an (etag, last_modified)
+    pair from a cheap query, or (None, None) when there is nothing to
+    validate against.
+    """
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if request.method != "GET":
+                    return await view(request, *args, **kwargs)
+                etag, last_modified = await validator(request, *args, **kwargs)
+                if etag is None:
+                    return await view(request, *args, **kwargs)
+                timestamp = int(last_modified.timestamp())
+                response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                return set_validators(response, etag, timestamp)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != "GET":
+                return view(request, *args, **kwargs)
+            etag, last_modified = validator(request, *args, **kwargs)
+            if etag is None:
+                return view(request, *args, **kwargs)
+            timestamp = int(last_modified.timestamp())
+            response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+            if response is None:
+                response = view(request, *args, **kwargs)
+            return set_validators(response, etag, timestamp)
+        return wrapper
+    return decorator
+
+
+def set_validators(response, etag, timestamp):
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(timestamp)
+    return response
@@ -0,0 +1,85 @@
+"""
+Newline-delimited JSON export of every album and post, shared by
+GET /api/export/ and manage.py export_blog.
+
+Rows are read with server-side cursors in chunks of chunk_size, and every
+chunk is written out before the next one is fetched, so memory use does
+not grow with the size of the tables.
+"""
+
+import json
+
+from .models import Album, Post
+
+EXPORT_CHUNK_SIZE = 2000
+ALBUM_EXPORT_FIELDS = ('id', 'title', 'description', 'imageURL', 'reference', 'created', 'updated')
+POST_EXPORT_FIELDS = ('id', 'user__username', 'title', 'content', 'imageURLs', 'videoURLs', 'album',
+                      'created', 'updated')
+
+
+def export_querysets():
+    # Albums come first, so a reader of the stream has seen every album
+    # before the posts that reference it.
+    return (
+        (Album.objects.only(*ALBUM_EXPORT_FIELDS).order_by('created', 'id'), create_album_record),
+        (Post.objects.select_related('user').only(*POST_EXPORT_FIELDS).order_by('created', 'id'),
+         create_post_record),
+    )
+
+
+def create_album_record(album):
+    return {
+        "type": "album",
+        "id": album.id,
+        "title": album.title,
+        "description": album.description,
+        "imageURL": album.imageURL,
+        "reference": album.reference,
+        "created": album.created.isoformat(),
+        "updated": album.updated.isoformat()
+    }
+
+
+def create_post_record(post):
+    return {
+        "type": "post",
+        "id": post.id,
+        "user": post.user.username if post.user else None,
+        "title": post.title,
+        "content": post.content,
+        "imageURLs": post.imageURLs,
+        "videoURLs": post.videoURLs,
+        "album": post.album_id,
+        "created": post.created.isoformat(),
+        "updated": post.updated.isoformat()
+    }
+
+
+def encode_record(record):
+    # Timestamps are written with full precision (unlike DjangoJSONEncoder),
+    # so an export loaded back with import_blog keeps the feed order exactly.
+    return json.dumps(record) + "\n"
+
+
+def export_chunks(chunk_size=EXPORT_CHUNK_SIZE):
+    chunk = []
+    for objects, create_record in export_querysets():
+        for obj in objects.iterator(chunk_size=chunk_size):
+            chunk.append(encode_record(create_record(obj)))
+            if len(chunk) >= chunk_size:
+                yield "".join(chunk)
+                chunk = []
+    if chunk:
+        yield "".join(chunk)
+
+
+async def aexport_chunks(chunk_size=EXPORT_CHUNK_SIZE):
+    chunk = []
+    for objects, create_record in export_querysets():
+        async for obj in objects.aiterator(chunk_size=chunk_size):
+            chunk.append(encode_record(create_record(obj)))
+            if len(chunk) >= chunk_size:
+                yield "".join(chunk)
+                chunk = []
+    if chunk:
+        yield "".join(chunk)
@@ -0,0 +1,62 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks import suite
+from benchmarks.utils import test_database
+
+
+class Command(BaseCommand):
+    help = ("Time the API's hot paths against a throwaway database seeded with --posts and --albums rows, "
+            "optionally comparing with an earlier run.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--albums', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=50, help="timed requests per scenario")
+        parser.add_argument('--warmup', type=int, default=5, help="untimed requests per scenario")
+        parser.add_argument('--cache', action='store_true', help="keep the API response cache on")
+        parser.add_argument('--output', '-o', help="write the results as JSON to this file")
+        parser.add_argument('--compare', help="JSON results of an earlier run to compare with")
+        parser.add_argument('--threshold', type=float, default=20,
+                            help="p50 increase in percent that counts as a regression")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as f:
+                baseline = json.load(f)
+
+        params = {name: options[name] for name in ('posts', 'albums', 'repeat', 'warmup', 'cache')}
+        with test_database():
+            staff = suite.seed(options['posts'], options['albums'])
+            results = {
+                "params": params,
+                "environment": suite.environment(),
+                "scenarios": suite.run(staff, options['repeat'], options['warmup'], options['cache']),
+            }
+
+        self.stdout.write("%-20s %10s %10s %10s %10s" % ("scenario", "p50 ms", "p95 ms", "p99 ms", "queries"))
+        for name, result in results["scenarios"].items():
+            self.stdout.write("%-20s %10.2f %10.2f %10.2f %10.1f" % (
+                name, result["p50"], result["p95"], result["p99"], result["queries"]))
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+
+        if baseline is not None:
+            self.report(baseline, results, options['threshold'])
+
+    def report(self, baseline, results, threshold):
+        if baseline["params"] != results["params"]:
+            self.stderr.write("The runs used different parameters: %s and %s" % (
+                baseline["params"], results["params"]))
+        rows, regressions = suite.compare(baseline["scenarios"], results["scenarios"], threshold)
+        self.stdout.write("\n%-20s %12s %10s %9s %12s" % ("scenario", "before ms", "p50 ms", "change", "queries"))
+        for name, before, after, change, queries_before, queries_after in rows:
+            line = "%-20s %12.2f %10.2f %8.1f%% %5.1f -> %.1f" % (
+                name, before, after, change, queries_before, queries_after)
+            self.stdout.write(self.style.ERROR(line) if name in regressions else line)
+        if regressions:
+            raise CommandError("%d scenario(s) regressed: %s" % (len(regressions), ", ".join(regressions)))
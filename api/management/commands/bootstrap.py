@@ -0,0 +1,47 @@
+import os
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.executor import MigrationExecutor
+
+# Arbitrary application-wide key for pg_advisory_lock.
+BOOTSTRAP_LOCK = 7215523001
+
+
+class Command(BaseCommand):
+    help = ("Apply migrations and create the superuser from SU_ADMIN/SU_PASSWORD/SU_EMAIL. "
+            "Safe to run from several replicas at once: a PostgreSQL advisory lock lets "
+            "only one of them migrate, the others wait and then find nothing to do.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        database = options['database']
+        connection = connections[database]
+        # Fast path for replicas started after the schema is up to date: no
+        # lock and no migrate run, just the migration plan check.
+        if not self.pending_migrations(connection) and not self.missing_superuser(database):
+            self.stdout.write("Nothing to bootstrap.")
+            return
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_lock(%s)", [BOOTSTRAP_LOCK])
+        try:
+            call_command('migrate', database=database, interactive=False, verbosity=options['verbosity'])
+            if self.missing_superuser(database):
+                User.objects.db_manager(database).create_superuser(
+                    os.environ['SU_ADMIN'], os.environ.get('SU_EMAIL', ''), os.environ.get('SU_PASSWORD'))
+                self.stdout.write("Created superuser %s." % os.environ['SU_ADMIN'])
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", [BOOTSTRAP_LOCK])
+
+    def pending_migrations(self, connection):
+        executor = MigrationExecutor(connection)
+        return executor.migration_plan(executor.loader.graph.leaf_nodes())
+
+    def missing_superuser(self, database):
+        username = os.environ.get('SU_ADMIN')
+        return bool(username) and not User.objects.db_manager(database).filter(username=username).exists()
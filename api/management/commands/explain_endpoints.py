@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+
+from api.models import Album, Post
+from api.views import encode_cursor
+
+NO_CACHE = {'api': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+class Command(BaseCommand):
+    help = "Print EXPLAIN ANALYZE for every query the read endpoints run."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page', type=int, default=1, help="page requested from the list endpoints")
+        parser.add_argument('--size', type=int, default=10, help="page size requested from the list endpoints")
+        parser.add_argument('--search', default="blog", help="search term for the search endpoints")
+
+    def handle(self, *args, **options):
+        page = {'page': options['page'], 'size': options['size']}
+        endpoints = [
+            ("post list", "/api/post/", page),
+            ("post list, cursor", "/api/post/", {'cursor': '', 'size': options['size']}),
+            ("post search", "/api/post/", dict(page, search=options['search'])),
+            ("album list", "/api/album/", page),
+            ("album search", "/api/album/", dict(page, search=options['search'])),
+        ]
+        # A cursor from the middle of the feed, so the keyset predicate is
+        # explained at depth and not only the first page.
+        feed = Post.objects.order_by('-created', '-id')
+        middle = feed[feed.count() // 2] if feed.exists() else None
+        if middle is not None:
+            for direction in ("next", "prev"):
+                endpoints.append(("post list, middle cursor %s" % direction, "/api/post/",
+                                  {'cursor': encode_cursor(middle, direction), 'size': options['size']}))
+        post_id = Post.objects.values_list('id', flat=True).first()
+        if post_id is not None:
+            endpoints.append(("post detail", "/api/post/%s/" % post_id, {}))
+        album_id = Album.objects.values_list('id', flat=True).first()
+        if album_id is not None:
+            endpoints.append(("album detail", "/api/album/%s/" % album_id, {}))
+            endpoints.append(("album posts", "/api/post/", dict(page, search=album_id)))
+            endpoints.append(("album with posts", "/api/album/%s/" % album_id, dict(page, include='posts')))
+
+        factory = RequestFactory()
+        for label, path, params in endpoints:
+            request = factory.get(path, params)
+            match = resolve(path)
+            with override_settings(CACHES=NO_CACHE), CaptureQueriesContext(connection) as queries:
+                match.func(request, *match.args, **match.kwargs)
+            self.stdout.write(self.style.MIGRATE_HEADING("== %s: %s" % (label, request.get_full_path())))
+            for query in queries:
+                self.stdout.write(self.style.SQL_KEYWORD(query['sql']))
+                self.stdout.write(self.explain(query['sql']))
+            self.stdout.write("")
+
+    def explain(self, sql):
+        # EXPLAIN ANALYZE executes the statement, so never keep its effects.
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("EXPLAIN (ANALYZE, BUFFERS) " + sql)
+                plan = "\n".join(row[0] for row in cursor.fetchall())
+            transaction.set_rollback(True)
+        return plan
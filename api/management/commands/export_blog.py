@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from api.export import EXPORT_CHUNK_SIZE, export_chunks
+
+
+class Command(BaseCommand):
+    help = "Write every album and post as newline-delimited JSON, albums first."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', help="file to write, default stdout")
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE,
+                            help="rows fetched from the database at a time")
+
+    def handle(self, *args, **options):
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                for chunk in export_chunks(options['chunk_size']):
+                    output.write(chunk)
+        else:
+            for chunk in export_chunks(options['chunk_size']):
+                self.stdout.write(chunk, ending='')
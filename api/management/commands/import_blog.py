@@ -0,0 +1,239 @@
+from contextlib import contextmanager
+import csv
+import io
+import json
+import sys
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DataError, IntegrityError, connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from api.cache import bump_generation
+from api.models import Album, Post
+
+BATCH_SIZE = 1000
+ALBUM_UPDATE_FIELDS = ['title', 'description', 'imageURL', 'reference', 'created', 'updated']
+POST_UPDATE_FIELDS = ['user', 'title', 'content', 'imageURLs', 'videoURLs', 'album', 'created', 'updated']
+
+
+@contextmanager
+def keep_created(*models):
+    # bulk_create runs pre_save, which would stamp auto_now_add fields with
+    # the import time. "updated" keeps auto_now: an import is a change as far
+    # as ETags and /api/sync/ are concerned.
+    fields = [model._meta.get_field('created') for model in models]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def parse_timestamp(value):
+    if not value:
+        return timezone.now()
+    timestamp = parse_datetime(value)
+    if timestamp is None:
+        raise ValueError("invalid timestamp %r" % value)
+    if timezone.is_naive(timestamp):
+        timestamp = timezone.make_aware(timestamp)
+    return timestamp
+
+
+def parse_urls(value):
+    # CSV cells hold the URL lists as JSON arrays.
+    if isinstance(value, str):
+        value = json.loads(value) if value else []
+    if value is None:
+        return []
+    if type(value) != list or not all(type(url) == str for url in value):
+        raise ValueError("invalid URL list")
+    return value
+
+
+def array_literal(values):
+    return "{%s}" % ",".join('"%s"' % value.replace('\\', '\\\\').replace('"', '\\"') for value in values)
+
+
+def copy_value(value):
+    if value is None:
+        return r'\N'
+    if isinstance(value, list):
+        value = array_literal(value)
+    elif hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+class Command(BaseCommand):
+    help = ("Upsert albums and posts from newline-delimited JSON (as written by export_blog) or CSV, "
+            "in batches, and report rows per second.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="file to read, - for stdin")
+        parser.add_argument('--format', choices=['ndjson', 'csv'],
+                            help="input format, default from the file extension")
+        parser.add_argument('--type', choices=['album', 'post'],
+                            help="row type for CSV input without a type column")
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--copy', action='store_true',
+                            help="load each batch with COPY into a staging table instead of a multi-row INSERT")
+
+    def handle(self, *args, **options):
+        input_format = options['format'] or ('csv' if options['path'].endswith('.csv') else 'ndjson')
+        self.batch_size = max(options['batch_size'], 1)
+        self.use_copy = options['copy']
+        self.verbosity = options['verbosity']
+        self.albums = []
+        self.posts = []
+        self.counts = {'album': 0, 'post': 0}
+        self.started = time.perf_counter()
+
+        if options['path'] == '-':
+            source = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+        else:
+            source = open(options['path'], encoding='utf-8', newline='')
+        try:
+            with source, keep_created(Album, Post):
+                if self.use_copy:
+                    self.create_staging_tables()
+                for line, record in self.read_records(source, input_format, options['type']):
+                    try:
+                        self.add(record)
+                    except (KeyError, TypeError, ValueError) as e:
+                        raise CommandError("line %d: invalid %s record: %s" % (line, record.get('type'), e))
+                self.flush_albums()
+                self.flush_posts()
+        finally:
+            # Every batch commits on its own, so a failed import may still
+            # have changed rows that cached responses show.
+            if any(self.counts.values()):
+                bump_generation()
+
+        elapsed = time.perf_counter() - self.started
+        rows = sum(self.counts.values())
+        self.stdout.write("Imported %d albums and %d posts in %.1fs (%d rows/s)" % (
+            self.counts['album'], self.counts['post'], elapsed, rows / elapsed if elapsed else rows))
+
+    def read_records(self, source, input_format, default_type):
+        if input_format == 'csv':
+            reader = csv.DictReader(source)
+            for row in reader:
+                row['type'] = row.get('type') or default_type
+                if row['type'] is None:
+                    raise CommandError("CSV input needs a type column or --type")
+                yield reader.line_num, row
+            return
+        for line, text in enumerate(source, 1):
+            if not text.strip():
+                continue
+            try:
+                record = json.loads(text)
+            except json.JSONDecodeError as e:
+                raise CommandError("line %d: %s" % (line, e))
+            if type(record) != dict:
+                raise CommandError("line %d: expected a JSON object" % line)
+            yield line, record
+
+    def add(self, record):
+        if record.get('type') == 'album':
+            self.albums.append(Album(id=record.get('id') or str(uuid.uuid4()),
+                                     title=record['title'],
+                                     description=record['description'],
+                                     imageURL=record.get('imageURL') or None,
+                                     reference=record.get('reference') or None,
+                                     created=parse_timestamp(record.get('created'))))
+            if len(self.albums) >= self.batch_size:
+                self.flush_albums()
+        elif record.get('type') == 'post':
+            # User and album references are resolved once per batch.
+            post = Post(id=record.get('id') or str(uuid.uuid4()),
+                        title=record['title'],
+                        content=record['content'],
+                        imageURLs=parse_urls(record.get('imageURLs')),
+                        videoURLs=parse_urls(record.get('videoURLs')),
+                        created=parse_timestamp(record.get('created')))
+            post.username = record.get('user') or None
+            post.album_id = record.get('album') or None
+            self.posts.append(post)
+            if len(self.posts) >= self.batch_size:
+                # Albums still waiting for their batch may be referenced here.
+                self.flush_albums()
+                self.flush_posts()
+        else:
+            raise ValueError("unknown type")
+
+    def flush_albums(self):
+        if not self.albums:
+            return
+        self.write(Album, self.albums, ALBUM_UPDATE_FIELDS)
+        self.albums = []
+
+    def flush_posts(self):
+        if not self.posts:
+            return
+        usernames = {post.username for post in self.posts if post.username}
+        users = dict(User.objects.filter(username__in=usernames).values_list('username', 'id')) if usernames else {}
+        album_ids = {post.album_id for post in self.posts if post.album_id}
+        albums = set(Album.objects.filter(id__in=album_ids).values_list('id', flat=True)) if album_ids else set()
+        for post in self.posts:
+            post.user_id = users.get(post.username)
+            if post.album_id not in albums:
+                post.album_id = None
+        self.write(Post, self.posts, POST_UPDATE_FIELDS)
+        self.posts = []
+
+    def write(self, model, objects, update_fields):
+        # A row may only be upserted once per statement, the last copy wins.
+        objects = list({obj.id: obj for obj in objects}.values())
+        now = timezone.now()
+        for obj in objects:
+            obj.updated = now
+        try:
+            with transaction.atomic():
+                if self.use_copy:
+                    self.copy(model, objects, update_fields)
+                else:
+                    model.objects.bulk_create(objects, update_conflicts=True, unique_fields=['id'],
+                                              update_fields=update_fields)
+        except (DataError, IntegrityError) as e:
+            raise CommandError("could not import %s batch: %s" % (model._meta.model_name, e))
+        kind = model._meta.model_name
+        self.counts[kind] += len(objects)
+        if self.verbosity >= 2:
+            elapsed = time.perf_counter() - self.started
+            self.stdout.write("%d %ss, %d rows/s" % (self.counts[kind], kind,
+                                                     sum(self.counts.values()) / elapsed))
+
+    def staging_table(self, model):
+        return "import_%s" % model._meta.db_table
+
+    def create_staging_tables(self):
+        with connection.cursor() as cursor:
+            for model in (Album, Post):
+                cursor.execute("CREATE TEMPORARY TABLE IF NOT EXISTS %s (LIKE %s)" % (
+                    connection.ops.quote_name(self.staging_table(model)),
+                    connection.ops.quote_name(model._meta.db_table)))
+
+    def copy(self, model, objects, update_fields):
+        fields = [model._meta.pk] + [model._meta.get_field(name) for name in update_fields]
+        columns = ", ".join(connection.ops.quote_name(field.column) for field in fields)
+        updates = ", ".join("%s = EXCLUDED.%s" % ((connection.ops.quote_name(field.column),) * 2)
+                            for field in fields[1:])
+        staging = connection.ops.quote_name(self.staging_table(model))
+        buffer = io.StringIO()
+        for obj in objects:
+            buffer.write("\t".join(copy_value(getattr(obj, field.attname)) for field in fields) + "\n")
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.copy_expert("COPY %s (%s) FROM STDIN" % (staging, columns), buffer)
+            cursor.execute("INSERT INTO %s (%s) SELECT %s FROM %s ON CONFLICT (%s) DO UPDATE SET %s" % (
+                connection.ops.quote_name(model._meta.db_table), columns, columns, staging,
+                connection.ops.quote_name(model._meta.pk.column), updates))
+            cursor.execute("TRUNCATE %s" % staging)
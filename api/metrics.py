@@ -0,0 +1,181 @@
+"""
+In-process request metrics, rendered in the Prometheus text format by
+GET /api/metrics/.
+
+api.middleware.MetricsMiddleware times every request and records, per view
+and method, the wall time, the time spent in the database, the number of
+queries and the response size into histograms. Queries are counted by an
+execute wrapper installed on every database connection, which reports to
+the recorder of the current request through a context variable, so queries
+run from sync_to_async threads under ASGI are counted as well.
+
+The histograms live in the worker process, so every gunicorn worker keeps
+and reports its own. Every series carries a pid label, so the series of one
+worker stay monotonic however the scrapes are spread between workers.
+"""
+
+from contextvars import ContextVar
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+_recorder = ContextVar('api_metrics_recorder', default=None)
+
+
+class QueryRecorder:
+    def __init__(self, keep_sql):
+        self.count = 0
+        self.duration = 0.0
+        self.keep_sql = keep_sql
+        self.queries = []
+
+    def add(self, sql, duration):
+        self.count += 1
+        self.duration += duration
+        if self.keep_sql:
+            self.queries.append((duration, sql))
+
+
+def record_queries(execute, sql, params, many, context):
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        recorder.add(sql, time.perf_counter() - start)
+
+
+def install_query_recorder(connection, **kwargs):
+    # Connected to connection_created, which fires again on every reconnect
+    # of the same connection object.
+    if record_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_queries)
+
+
+def start_request():
+    recorder = QueryRecorder(keep_sql=bool(settings.API_SLOW_REQUEST_MS or settings.API_SLOW_REQUEST_QUERIES))
+    return recorder, _recorder.set(recorder)
+
+
+def finish_request(request, response, recorder, token, duration):
+    _recorder.reset(token)
+    match = request.resolver_match
+    view = match.view_name if match else "unmatched"
+    size = None if response.streaming else len(response.content)
+    registry.observe(view, request.method, response.status_code, duration, recorder, size)
+    if is_slow(duration, recorder):
+        log_slow_request(request, view, response.status_code, duration, recorder)
+
+
+def is_slow(duration, recorder):
+    return ((settings.API_SLOW_REQUEST_MS and duration * 1000 >= settings.API_SLOW_REQUEST_MS) or
+            (settings.API_SLOW_REQUEST_QUERIES and recorder.count >= settings.API_SLOW_REQUEST_QUERIES))
+
+
+def log_slow_request(request, view, status, duration, recorder):
+    lines = ["slow request %s %s (%s) %d: %.1fms, %d queries in %.1fms" % (
+        request.method, request.get_full_path(), view, status, duration * 1000,
+        recorder.count, recorder.duration * 1000)]
+    for query_duration, sql in recorder.queries:
+        lines.append("  %8.2fms  %s" % (query_duration * 1000, sql))
+    logger.warning("\n".join(lines))
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def render(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append('%s_bucket{%s,le="%s"} %d' % (name, labels, bound, cumulative))
+        lines.append('%s_bucket{%s,le="+Inf"} %d' % (name, labels, self.count))
+        lines.append('%s_sum{%s} %s' % (name, labels, self.sum))
+        lines.append('%s_count{%s} %d' % (name, labels, self.count))
+        return lines
+
+
+HISTOGRAMS = (
+    ('api_request_duration_seconds', "Wall time of the request.", DURATION_BUCKETS),
+    ('api_request_db_duration_seconds', "Time spent executing SQL.", DURATION_BUCKETS),
+    ('api_request_queries', "SQL queries executed.", QUERY_BUCKETS),
+    ('api_response_size_bytes', "Response body size, streaming responses excluded.", SIZE_BUCKETS),
+)
+HISTOGRAM_BUCKETS = {name: buckets for name, _, buckets in HISTOGRAMS}
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = {}
+            self.histograms = {name: {} for name, _, _ in HISTOGRAMS}
+
+    def histogram(self, name, key):
+        histograms = self.histograms[name]
+        if key not in histograms:
+            histograms[key] = Histogram(HISTOGRAM_BUCKETS[name])
+        return histograms[key]
+
+    def observe(self, view, method, status, duration, recorder, size):
+        key = (view, method)
+        with self.lock:
+            self.requests[key + (status,)] = self.requests.get(key + (status,), 0) + 1
+            self.histogram('api_request_duration_seconds', key).observe(duration)
+            self.histogram('api_request_db_duration_seconds', key).observe(recorder.duration)
+            self.histogram('api_request_queries', key).observe(recorder.count)
+            if size is not None:
+                self.histogram('api_response_size_bytes', key).observe(size)
+
+    def render(self):
+        lines = [
+            "# HELP api_requests_total Requests handled, by view, method and status.",
+            "# TYPE api_requests_total counter",
+        ]
+        # Read at render time, gunicorn forks the workers after the import.
+        pid = os.getpid()
+        with self.lock:
+            for (view, method, status), count in sorted(self.requests.items()):
+                lines.append('api_requests_total{pid="%d",view="%s",method="%s",status="%d"} %d' % (
+                    pid, escape(view), escape(method), status, count))
+            for name, description, _ in HISTOGRAMS:
+                lines.append("# HELP %s %s" % (name, description))
+                lines.append("# TYPE %s histogram" % name)
+                for (view, method), histogram in sorted(self.histograms[name].items()):
+                    lines.extend(histogram.render(name, 'pid="%d",view="%s",method="%s"' % (
+                        pid, escape(view), escape(method))))
+        return "\n".join(lines) + "\n"
+
+
+def escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registry = Registry()
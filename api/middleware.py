@@ -0,0 +1,149 @@
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .metrics import finish_request, start_request
+from .profiler import PROFILE_HEADER, profile_request
+from .responses import JsonResponse
+from .tokens import get_token_user
+
+INVALID_TOKEN = "invalid token"
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoiseMiddleware that can also sit in an async middleware chain.
+
+    The stock middleware is sync only, so under ASGI Django would run every
+    request, static or not, through a sync_to_async hop just to pass it on.
+    Without autorefresh (i.e. outside DEBUG) a static path is looked up in
+    an in-memory table, so the async path does that inline and awaits the
+    rest of the chain directly.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
+
+
+class TokenAuthenticationMiddleware:
+    """
+    Authenticate "Authorization: Bearer <token>" requests from the token
+    alone, so neither the session nor the user row is read. Requests
+    without the header keep the session user of AuthenticationMiddleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.authenticate(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        return self.authenticate(request) or await self.get_response(request)
+
+    def authenticate(self, request):
+        authorization = request.headers.get('Authorization', '')
+        if not authorization.startswith('Bearer '):
+            return None
+        try:
+            user = get_token_user(authorization[len('Bearer '):].strip())
+        except signing.BadSignature:
+            return JsonResponse({"message":INVALID_TOKEN}, status=401)
+
+        async def auser():
+            return user
+        request.user = user
+        request.auser = auser
+        request.token_user = True
+        # Browsers never attach bearer tokens by themselves, so there is no
+        # cross-site request to protect against.
+        request._dont_enforce_csrf_checks = True
+        return None
+
+
+class MetricsMiddleware:
+    """
+    Record the wall time, database time, query count and response size of
+    every request into api.metrics. Off when API_METRICS is false.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.API_METRICS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder, token = start_request()
+        start = time.perf_counter()
+        response = self.get_response(request)
+        finish_request(request, response, recorder, token, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        recorder, token = start_request()
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        finish_request(request, response, recorder, token, time.perf_counter() - start)
+        return response
+
+
+class ProfilerMiddleware:
+    """
+    Run the rest of the chain, view included, under cProfile for staff
+    requests sending "X-Profile: 1" and for API_PROFILER_SAMPLE_RATE of all
+    requests. Unless API_PROFILER is set the middleware is dropped from the
+    chain when it is loaded, so it costs nothing.
+
+    It is sync only: under ASGI the queries of the async views run in other
+    threads and would be missing from the profile.
+    """
+
+    def __init__(self, get_response):
+        if not settings.API_PROFILER:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if self.should_profile(request):
+            return profile_request(self.get_response, request)
+        return self.get_response(request)
+
+    def should_profile(self, request):
+        if request.headers.get(PROFILE_HEADER) == '1' and request.user.is_staff:
+            return True
+        return random.random() < settings.API_PROFILER_SAMPLE_RATE
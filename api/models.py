@@ -1,5 +1,7 @@
 from django.contrib.auth.models import User
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 
 class Album(models.Model):
@@ -8,14 +10,45 @@ class Album(models.Model):
     description = models.TextField()
     imageURL = models.CharField(max_length=250, blank=True, null=True)
     created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True, db_index=True)
     reference = models.CharField(max_length=50, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created', '-id'], name='api_album_created_id_idx'),
+            GinIndex(fields=['title'], name='api_album_title_trgm', opclasses=['gin_trgm_ops']),
+            GinIndex(fields=['description'], name='api_album_description_trgm', opclasses=['gin_trgm_ops']),
+            GinIndex(fields=['reference'], name='api_album_reference_trgm', opclasses=['gin_trgm_ops']),
+        ]
+
 class Post(models.Model):
     id = models.CharField(max_length=50, primary_key=True)
     user = models.ForeignKey(User, blank=True, null=True, on_delete=models.SET_NULL)
     title = models.CharField(max_length=250)
     content = models.TextField()
     created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True, db_index=True)
     imageURLs = ArrayField(models.CharField(max_length=300, blank=True, null=True), blank=True, null=True, default=list)
     videoURLs = ArrayField(models.CharField(max_length=300, blank=True, null=True), blank=True, null=True, default=list)
-    album = models.ForeignKey(Album, blank=True, null=True, on_delete=models.SET_NULL)
\ No newline at end of file
+    album = models.ForeignKey(Album, blank=True, null=True, on_delete=models.SET_NULL)
+    # Maintained by a database trigger from title and content, see migration 0002.
+    search_vector = SearchVectorField(blank=True, null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created', '-id'], name='api_post_created_id_idx'),
+            models.Index(fields=['album', '-created'], name='api_post_album_created_idx'),
+            GinIndex(fields=['search_vector'], name='api_post_search_gin'),
+        ]
+
+class Tombstone(models.Model):
+    POST = 'post'
+    ALBUM = 'album'
+    KIND_CHOICES = [
+        (POST, 'Post'),
+        (ALBUM, 'Album'),
+    ]
+    id = models.BigAutoField(primary_key=True)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.CharField(max_length=50)
+    deleted = models.DateTimeField(auto_now_add=True, db_index=True)
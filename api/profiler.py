@@ -0,0 +1,67 @@
+"""
+cProfile captures of live requests, taken by api.middleware.ProfilerMiddleware
+and served to staff by /api/profiles/.
+
+Each capture is written to API_PROFILER_DIR as a .pstats file, which loads
+with pstats, snakeviz, or flameprof/gprof2dot for a flamegraph. Only the
+newest API_PROFILER_MAX_FILES captures are kept.
+"""
+
+import cProfile
+import os
+import re
+import uuid
+
+from django.conf import settings
+from django.utils import timezone
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_NAME = re.compile(r'^[\w-]+\.pstats$')
+
+
+def profile_request(get_response, request):
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler is already running in this thread.
+        return get_response(request)
+    try:
+        response = get_response(request)
+    finally:
+        profiler.disable()
+    response[PROFILE_HEADER] = save_profile(profiler, request)
+    return response
+
+
+def save_profile(profiler, request):
+    match = request.resolver_match
+    view = re.sub(r'\W+', '-', match.view_name if match else "unmatched")
+    name = "%s-%s-%s.pstats" % (timezone.now().strftime('%Y%m%dT%H%M%S%f'), view, uuid.uuid4().hex[:8])
+    os.makedirs(settings.API_PROFILER_DIR, exist_ok=True)
+    profiler.dump_stats(os.path.join(settings.API_PROFILER_DIR, name))
+    prune_profiles()
+    return name
+
+
+def list_profiles():
+    if not os.path.isdir(settings.API_PROFILER_DIR):
+        return []
+    return sorted((name for name in os.listdir(settings.API_PROFILER_DIR) if PROFILE_NAME.match(name)),
+                  reverse=True)
+
+
+def prune_profiles():
+    for name in list_profiles()[settings.API_PROFILER_MAX_FILES:]:
+        try:
+            os.remove(os.path.join(settings.API_PROFILER_DIR, name))
+        except FileNotFoundError:
+            pass
+
+
+def profile_path(name):
+    # Only names written by save_profile, never a path out of the directory.
+    if not PROFILE_NAME.match(name):
+        return None
+    path = os.path.join(settings.API_PROFILER_DIR, name)
+    return path if os.path.isfile(path) else None
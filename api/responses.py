@@ -0,0 +1,69 @@
+"""
+JSON responses for the API views.
+
+JsonResponse here is a drop-in for django.http.JsonResponse that serializes
+with the encoder named by the API_JSON_ENCODER setting: "orjson", which
+encodes the whole response, datetimes included, in one pass in C, or
+"json", the standard library with a default() for datetimes. Left empty,
+orjson is used when it is installed.
+
+Both encoders produce the same bytes: compact separators, UTF-8 and
+datetimes in ISO 8601 with full precision and a Z suffix for UTC.
+"""
+
+import datetime
+import json
+import uuid
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def default(value):
+    if isinstance(value, datetime.datetime):
+        value = value.isoformat()
+        return value[:-6] + "Z" if value.endswith("+00:00") else value
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    raise TypeError("Object of type %s is not JSON serializable" % type(value).__name__)
+
+
+def encode_json(data):
+    return json.dumps(data, default=default, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def encode_orjson(data):
+    return orjson.dumps(data, option=orjson.OPT_UTC_Z)
+
+
+ENCODERS = {
+    'json': encode_json,
+    'orjson': encode_orjson,
+}
+
+
+def get_encoder():
+    name = settings.API_JSON_ENCODER or ('orjson' if orjson else 'json')
+    if name not in ENCODERS:
+        raise ImproperlyConfigured("API_JSON_ENCODER must be one of %s" % ", ".join(sorted(ENCODERS)))
+    if name == 'orjson' and orjson is None:
+        raise ImproperlyConfigured("API_JSON_ENCODER is orjson but orjson is not installed")
+    return ENCODERS[name]
+
+
+def encode(data):
+    return get_encoder()(data)
+
+
+class JsonResponse(HttpResponse):
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=encode(data), **kwargs)
@@ -0,0 +1,43 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.functions import Now
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .cache import bump_generation
+from .models import Album, Post, Tombstone
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Album)
+@receiver(post_delete, sender=Album)
+def invalidate_response_cache(sender, **kwargs):
+    # Deletes and admin saves run inside a transaction. Bumping before it
+    # commits would let a concurrent reader cache the old rows under the
+    # new generation.
+    transaction.on_commit(bump_generation)
+
+
+@receiver(post_delete, sender=Post)
+def record_post_deletion(sender, instance, **kwargs):
+    Tombstone.objects.create(kind=Tombstone.POST, object_id=instance.id)
+
+
+@receiver(post_delete, sender=Album)
+def record_album_deletion(sender, instance, **kwargs):
+    Tombstone.objects.create(kind=Tombstone.ALBUM, object_id=instance.id)
+
+
+# Deleting an album or a user sets the foreign key of their posts to NULL
+# with a raw UPDATE, which neither touches Post.updated nor sends signals.
+# Mark those posts as changed first, so /api/sync/ and the ETags see them.
+@receiver(pre_delete, sender=Album)
+def touch_album_posts(sender, instance, **kwargs):
+    Post.objects.filter(album_id=instance.pk).update(updated=Now())
+
+
+@receiver(pre_delete, sender=User)
+def touch_user_posts(sender, instance, **kwargs):
+    if Post.objects.filter(user_id=instance.pk).update(updated=Now()):
+        transaction.on_commit(bump_generation)
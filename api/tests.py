@@ -1,8 +1,26 @@
-from django.test import TestCase
+from asgiref.sync import sync_to_async
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.management import CommandError, call_command
+from django.db import connection
 from django.contrib.auth.models import User
 from django.test.client import Client
-from django.urls import reverse
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from api import async_views, metrics, responses
+from api.cache import GENERATION_KEY, bump_generation, get_cache, get_generation
+from api.middleware import ProfilerMiddleware
 from api.models import Post, Album
+from benchmarks import suite
+import datetime
+import io
+import json
+import os
+import pstats
+import tempfile
 import uuid
 
 CONTENT_JSON = "application/json"
@@ -16,10 +34,23 @@ IMAGEURL = "https://images.all-free-download.com/images/graphicthumb/river_dane_
 INVALID_ID = "invalid id"
 ADMIN_PASSWORD = "12345"
 
-class TestLogin(TestCase):
+
+class ApiTestCase(TestCase):
+    # Rows from setUpTestData are created once per class, so unlike rows
+    # created in setUp they no longer bump the response cache generation
+    # before every test. Start every test with an empty cache instead.
+    def setUp(self):
+        get_cache().clear()
+
+
+class TestLogin(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.adminPassword = ADMIN_PASSWORD
+        cls.test_admin = User.objects.create_superuser('test', password=cls.adminPassword)
+
     def setUp(self):
-        self.adminPassword = ADMIN_PASSWORD
-        self.test_admin = User.objects.create_superuser('test', password=self.adminPassword)
+        super().setUp()
         self.c = Client()
 
     # Login tests
@@ -76,20 +107,24 @@ class TestLogin(TestCase):
 
 
 
-class TestApi(TestCase):
-    def setUp(self):
-        self.adminPassword = ADMIN_PASSWORD
-        self.test_admin = User.objects.create_superuser('test', password=self.adminPassword)
-        self.c = Client()
-        self.test_post = Post.objects.create(id=str(uuid.uuid4()),
+class TestApi(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.adminPassword = ADMIN_PASSWORD
+        cls.test_admin = User.objects.create_superuser('test', password=cls.adminPassword)
+        cls.test_post = Post.objects.create(id=str(uuid.uuid4()),
             title=TITLE,
             content=CONTENT,
-            user=self.test_admin)
+            user=cls.test_admin)
         
-        self.test_album = Album.objects.create(id=str(uuid.uuid4()),
+        cls.test_album = Album.objects.create(id=str(uuid.uuid4()),
             title=TITLE,
             description=DESCRIPTION)
 
+    def setUp(self):
+        super().setUp()
+        self.c = Client()
+
     # Posts api tests
     def testGetPosts(self):
         response = self.c.get(reverse('api_post'))
@@ -650,3 +685,1416 @@ class TestApi(TestCase):
         response = self.c.delete(reverse('api_album_id', kwargs=kwargs))
         self.assertEquals(response.status_code, 400)
 
+
+
+class TestCursorPagination(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_posts = []
+        for i in range(3):
+            cls.test_posts.append(Post.objects.create(id=str(uuid.uuid4()),
+                title=TITLE,
+                content=CONTENT))
+        cls.test_posts.reverse()
+
+    def setUp(self):
+        super().setUp()
+        self.c = Client()
+
+    def testGetPostsWithCursor(self):
+        response = self.c.get(reverse('api_post'), {'cursor': '', 'size': '2'})
+        self.assertEquals(response.status_code, 200)
+        page = response.json()["page"]
+        self.assertEquals([post["id"] for post in response.json()["posts"]],
+            [post.id for post in self.test_posts[:2]])
+        self.assertTrue(page["hasNext"])
+        self.assertFalse(page["hasPrev"])
+        self.assertEquals(page["prevCursor"], None)
+
+        response = self.c.get(reverse('api_post'), {'cursor': page["nextCursor"], 'size': '2'})
+        page = response.json()["page"]
+        self.assertEquals([post["id"] for post in response.json()["posts"]],
+            [self.test_posts[2].id])
+        self.assertFalse(page["hasNext"])
+        self.assertTrue(page["hasPrev"])
+        self.assertEquals(page["nextCursor"], None)
+
+        response = self.c.get(reverse('api_post'), {'cursor': page["prevCursor"], 'size': '2'})
+        self.assertEquals([post["id"] for post in response.json()["posts"]],
+            [post.id for post in self.test_posts[:2]])
+        self.assertFalse(response.json()["page"]["hasPrev"])
+
+    def testGetPostsWithCursorOnEqualCreated(self):
+        Post.objects.update(created=timezone.now())
+        expected = sorted((post.id for post in self.test_posts), reverse=True)
+        ids = []
+        params = {'cursor': '', 'size': '1'}
+        for _ in expected:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.c.get(reverse('api_post'), params)
+            ids.extend(post["id"] for post in response.json()["posts"])
+            params['cursor'] = response.json()["page"]["nextCursor"]
+        self.assertEquals(ids, expected)
+        # The range scan is bounded by created, not only by the OR.
+        self.assertIn('"api_post"."created" <=', queries[-1]['sql'])
+        response = self.c.get(reverse('api_post'),
+            {'cursor': response.json()["page"]["prevCursor"], 'size': '2'})
+        self.assertEquals([post["id"] for post in response.json()["posts"]], expected[:2])
+
+    def testGetPostsWithCursorSkipsCount(self):
+        # The two ETag aggregates and the page itself.
+        with self.assertNumQueries(3):
+            response = self.c.get(reverse('api_post'), {'cursor': '', 'size': '1'})
+        self.assertEquals(response.status_code, 200)
+
+    def testGetPostsWithInvalidCursor(self):
+        response = self.c.get(reverse('api_post'), {'cursor': 'invalid cursor'})
+        self.assertEquals(response.status_code, 400)
+
+    def testGetAlbumsWithCursor(self):
+        Album.objects.create(id=str(uuid.uuid4()), title=TITLE, description=DESCRIPTION)
+        response = self.c.get(reverse('api_album'), {'cursor': ''})
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(len(response.json()["albums"]), 1)
+        self.assertFalse(response.json()["page"]["hasNext"])
+
+
+class TestPostSearch(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_album = Album.objects.create(id=str(uuid.uuid4()),
+            title=TITLE,
+            description=DESCRIPTION)
+        cls.title_post = Post.objects.create(id=str(uuid.uuid4()),
+            title="mountain trip",
+            content=CONTENT,
+            album=cls.test_album)
+        cls.content_post = Post.objects.create(id=str(uuid.uuid4()),
+            title=TITLE,
+            content="a day in the mountains")
+
+    def setUp(self):
+        super().setUp()
+        self.c = Client()
+
+    def testSearchRanksTitleMatchesFirst(self):
+        response = self.c.get(reverse('api_post'), {'search': 'mountain'})
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals([post["id"] for post in response.json()["posts"]],
+            [self.title_post.id, self.content_post.id])
+
+    def testSearchTracksEdits(self):
+        self.content_post.content = CONTENT
+        self.content_post.save()
+        response = self.c.get(reverse('api_post'), {'search': 'mountain'})
+        self.assertEquals([post["id"] for post in response.json()["posts"]], [self.title_post.id])
+
+    def testSearchByAlbumId(self):
+        response = self.c.get(reverse('api_post'), {'search': self.test_album.id})
+        self.assertEquals([post["id"] for post in response.json()["posts"]], [self.title_post.id])
+
+    def testSearchDoesNotMatchSubstrings(self):
+        response = self.c.get(reverse('api_post'), {'search': 'ountai'})
+        self.assertEquals(response.json()["posts"], [])
+
+    def testSubstringSearchMode(self):
+        response = self.c.get(reverse('api_post'), {'search': 'ountai', 'searchMode': 'substring'})
+        self.assertEquals(len(response.json()["posts"]), 2)
+
+
+
+class TestAlbumSearch(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.close_album = Album.objects.create(id=str(uuid.uuid4()),
+            title="summer vacation",
+            description=DESCRIPTION)
+        cls.far_album = Album.objects.create(id=str(uuid.uuid4()),
+            title=TITLE,
+            description="photos from our summer vacation in the mountains")
+
+    def setUp(self):
+        super().setUp()
+        self.c = Client()
+
+    def testSearchByAlbumId(self):
+        response = self.c.get(reverse('api_album'), {'search': self.far_album.id})
+        self.assertEquals([album["id"] for album in response.json()["albums"]], [self.far_album.id])
+
+    def testSearchByReference(self):
+        self.far_album.reference = "trip-2021"
+        self.far_album.save()
+        response = self.c.get(reverse('api_album'), {'search': 'trip-20'})
+        self.assertEquals([album["id"] for album in response.json()["albums"]], [self.far_album.id])
+
+    def testSimilaritySearchOrdering(self):
+        response = self.c.get(reverse('api_album'), {'search': 'summer vacation', 'searchMode': 'similarity'})
+        self.assertEquals([album["id"] for album in response.json()["albums"]],
+            [self.close_album.id, self.far_album.id])
+
+    def testSimilaritySearchMatchesMisspellings(self):
+        response = self.c.get(reverse('api_album'), {'search': 'sumer vacaton', 'searchMode': 'similarity'})
+        self.assertEquals([album["id"] for album in response.json()["albums"]], [self.close_album.id])
+        response = self.c.get(reverse('api_album'), {'search': 'sumer vacaton'})
+        self.assertEquals(response.json()["albums"], [])
+
+
+class TestPostQueries(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_admin = User.objects.create_superuser('test', password=ADMIN_PASSWORD)
+        cls.test_album = Album.objects.create(id=str(uuid.uuid4()),
+            title=TITLE,
+            description=DESCRIPTION)
+        for i in range(20):
+            cls.test_post = Post.objects.create(id=str(uuid.uuid4()),
+                title=TITLE,
+                content=CONTENT,
+                user=cls.test_admin,
+                album=cls.test_album)
+
+    def setUp(self):
+        super().setUp()
+        self.c = Client()
+
+    def testGetPostsQueryCountIsConstant(self):
+        for size in ('1', '20'):
+            # The two ETag aggregates, the paginator count and the page itself.
+            with self.assertNumQueries(4):
+                response = self.c.get(reverse('api_post'), {'size': size})
+            self.assertEquals(len(response.json()["posts"]), int(size))
+            self.assertEquals(response.json()["posts"][0]["user"], self.test_admin.username)
+            self.assertEquals(response.json()["posts"][0]["album"], self.test_album.id)
+
+    def testGetPostByIdQueryCount(self):
+        kwargs = {
+            "post_id": self.test_post.id
+        }
+        with self.assertNumQueries(2):
+            response = self.c.get(reverse('api_post_id', kwargs=kwargs))
+        self.assertEquals(response.json()["user"], self.test_admin.username)
+        self.assertEquals(response.json()["album"], self.test_album.id)
+
+
+class TestWriteQueries(ApiTestCase):
+    # Every authenticated request starts with the session and user lookups.
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_admin = User.objects.create_superuser('test', password=ADMIN_PASSWORD)
+        cls.test_album = Album.objects.create(id=str(uuid.uuid4()),
+            title=TITLE,
+            description=DESCRIPTION)
+        cls.test_post = Post.objects.create(id=str(uuid.uuid4()),
+            title=TITLE,
+            content=CONTENT,
+            user=cls.test_admin)
+
+    def setUp(self):
+        super().setUp()
+        self.c = Client()
+        self.c.login(username=self.test_admin.username, password=ADMIN_PASSWORD)
+
+    def testCreatePostQueryCount(self):
+        body = {
+            "title": TITLE,
+            "content": CONTENT,
+            "imageURLs": IMAGEURLS,
+            "videoURLs": VIDEOURLS
+        }
+        # Session, user and one INSERT.
+        with self.assertNumQueries(3):
+            response = self.c.post(reverse('api_post'), body, content_type=CONTENT_JSON)
+        self.assertEquals(response.status_code, 201)
+        post = Post.objects.get(id=response.json()["id"])
+        self.assertEquals(post.imageURLs, IMAGEURLS)
+        self.assertEquals(post.videoURLs, VIDEOURLS)
+
+    def testCreatePostWithAlbumQueryCount(self):
+        body = {
+            "title": TITLE,
+            "content": CONTENT,
+            "album": self.test_album.id
+        }
+        # Session, user, the album existence check and one INSERT.
+        with self.assertNumQueries(4):
+            response = self.c.post(reverse('api_post'), body, content_type=CONTENT_JSON)
+        self.assertEquals(Post.objects.get(id=response.json()["id"]).album_id, self.test_album.id)
+
+    def testEditPostQueryCount(self):
+        kwargs = {
+            "post_id": self.test_post.id
+        }
+        body = {
+            "title": "new title",
+            "album": self.test_album.id
+        }
+        with CaptureQueriesContext(connection) as queries:
+            response = self.c.put(reverse('api_post_id', kwargs=kwargs), body, content_type=CONTENT_JSON)
+        # Session, user, the post, the album existence check and one UPDATE.
+        self.assertEquals(len(queries), 5)
+        update = queries[-1]['sql']
+        self.assertTrue(update.startswith('UPDATE "api_post" SET "title" = '))
+        self.assertNotIn('"content"', update)
+        self.assertIn('"album_id"', update)
+        self.assertEquals(response.json()["title"], "new title")
+        post = Post.objects.get(id=self.test_post.id)
+        self.assertEquals(post.album_id, self.test_album.id)
+        self.assertGreater(post.updated, self.test_post.updated)
+
+    def testCreateAlbumQueryCount(self):
+        body = {
+            "title": TITLE,
+            "description": DESCRIPTION,
+            "imageURL": IMAGEURL
+        }
+        # Session, user and one INSERT.
+        with self.assertNumQueries(3):
+            response = self.c.post(reverse('api_album'), body, content_type=CONTENT_JSON)
+        self.assertEquals(response.status_code, 201)
+        self.assertEquals(Album.objects.get(id=response.json()["id"]).imageURL, IMAGEURL)
+
+    def testEditAlbumQueryCount(self):
+        kwargs = {
+            "album_id": self.test_album.id
+        }
+        with CaptureQueriesContext(connection) as queries:
+            response = self.c.put(reverse('api_album_id', kwargs=kwargs), {"imageURL": IMAGEURL},
+                content_type=CONTENT_JSON)
+        # Session, user, the album and one UPDATE.
+        self.assertEquals(len(queries), 4)
+        self.assertNotIn('"title"', queries[-1]['sql'])
+        self.assertEquals(response.json()["imageURL"], IMAGEURL)
+
+
+class TestAuthQueries(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_admin = User.objects.create_superuser('test', password=ADMIN_PASSWORD)
+        cls.test_user = User.objects.create_user('user', password=ADMIN_PASSWORD)
+        cls.test_post = Post.objects.create(id=str(uuid.uuid4()),
+            title=TITLE,
+            content=CONTENT)
+
+    def setUp(self):
+        super().setUp()
+        self.c = Client()
+
+    def countUserQueries(self, method, url, *args, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            response = method(url, *args, **kwargs)
+        return response, len([query for query in queries if 'FROM "auth_user"' in query['sql']])
+
+    def testWritesDoNotRequeryUser(self):
+        self.c.force_login(self.test_admin)
+        kwargs = {
+            "post_id": self.test_post.id
+        }
+        body = {
+            "title": TITLE,
+            "content": CONTENT
+        }
+        for method in (self.c.put, self.c.delete):
+            response, user_queries = self.countUserQueries(method,
+                reverse('api_post_id', kwargs=kwargs), body, content_type=CONTENT_JSON)
+            self.assertEquals(response.status_code, 200)
+            self.assertEquals(user_queries, 1)
+        response, user_queries = self.countUserQueries(self.c.post,
+            reverse('api_post'), body, content_type=CONTENT_JSON)
+        self.assertEquals(response.status_code, 201)
+        self.assertEquals(user_queries, 1)
+        self.assertEquals(Post.objects.get(id=response.json()["id"]).user, self.test_admin)
+
+    def testAnonymousWriteDoesNotQueryUser(self):
+        kwargs = {
+            "post_id": self.test_post.id
+        }
+        response, user_queries = self.countUserQueries(self.c.delete, reverse('api_post_id', kwargs=kwargs))
+        self.assertEquals(response.status_code, 401)
+        self.assertEquals(user_queries, 0)
+
+    def testNonStaffWriteIsRejected(self):
+        self.c.force_login(self.test_user)
+        kwargs = {
+            "post_id": self.test_post.id
+        }
+        response = self.c.delete(reverse('api_post_id', kwargs=kwargs))
+        self.assertEquals(response.status_code, 401)
+
+    def testLogoutDoesNotRequeryUser(self):
+        self.c.force_login(self.test_user)
+        response, user_queries = self.countUserQueries(self.c.get, reverse('logout'))
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(user_queries, 1)
+
+
+
+class TestTokenAuth(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_admin = User.objects.create_superuser('test', password=ADMIN_PASSWORD)
+        cls.test_user = User.objects.create_user('user', password=ADMIN_PASSWORD)
+        cls.test_post = Post.objects.create(id=str(uuid.uuid4()),
+            title=TITLE,
+            content=CONTENT)
+
+    def setUp(self):
+        super().setUp()
+        self.c = Client(enforce_csrf_checks=True)
+
+    def getToken(self, username):
+        body = {
+            "username": username,
+            "password": ADMIN_PASSWORD,
+            "token": True
+        }
+        response = self.c.post(reverse('login'), body, content_type=CONTENT_JSON)
+        self.assertEquals(response.status_code, 200)
+        return response.json()["token"]
+
+    def testTokenLoginDoesNotStartSession(self):
+        self.getToken(self.test_admin.username)
+        self.assertNotIn('sessionid', self.c.cookies)
+
+    def testTokenLogoutIsRejected(self):
+        token = self.getToken(self.test_admin.username)
+        response = self.c.post(reverse('logout'), headers={'Authorization': 'Bearer ' + token})
+        self.assertEquals(response.status_code, 400)
+        self.assertEquals(response.json()["message"], "tokens cannot be revoked")
+        response = self.c.get(reverse('api_profiles'), headers={'Authorization': 'Bearer ' + token})
+        self.assertEquals(response.status_code, 200)
+
+    def testTokenReadDoesNotQueryAuth(self):
+        token = self.getToken(self.test_admin.username)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.c.get(reverse('api_post'), headers={'Authorization': 'Bearer ' + token})
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(len([query for query in queries if 'FROM "auth_user"' in query['sql']]), 0)
+
+    def testTokenWriteQueriesUserOnce(self):
+        token = self.getToken(self.test_admin.username)
+        body = {
+            "title": TITLE,
+            "content": CONTENT
+        }
+        with CaptureQueriesContext(connection) as queries:
+            response = self.c.post(reverse('api_post'), body, content_type=CONTENT_JSON,
+                headers={'Authorization': 'Bearer ' + token})
+        self.assertEquals(response.status_code, 201)
+        self.assertEquals(len(queries), 2)
+        self.assertEquals(len([query for query in queries if 'FROM "auth_user"' in query['sql']]), 1)
+        self.assertEquals(Post.objects.get(id=response.json()["id"]).user, self.test_admin)
+
+    def testChangedUserLosesTokenStaffAccess(self):
+        token = self.getToken(self.test_admin.username)
+        kwargs = {
+            "post_id": self.test_post.id
+        }
+        for change in ({'is_staff': False}, {'is_active': False}):
+            User.objects.filter(id=self.test_admin.id).update(**change)
+            response = self.c.delete(reverse('api_post_id', kwargs=kwargs),
+                headers={'Authorization': 'Bearer ' + token})
+            self.assertEquals(response.status_code, 401)
+            response = self.c.get(reverse('api_metrics'), headers={'Authorization': 'Bearer ' + token})
+            self.assertEquals(response.status_code, 401)
+            User.objects.filter(id=self.test_admin.id).update(is_staff=True, is_active=True)
+        self.test_admin.delete()
+        response = self.c.delete(reverse('api_post_id', kwargs=kwargs), headers={'Authorization': 'Bearer ' + token})
+        self.assertEquals(response.status_code, 401)
+        self.assertTrue(Post.objects.filter(id=self.test_post.id).exists())
+
+    def testNonStaffTokenWriteIsRejected(self):
+        token = self.getToken(self.test_user.username)
+        kwargs = {
+            "post_id": self.test_post.id
+        }
+        response = self.c.delete(reverse('api_post_id', kwargs=kwargs), headers={'Authorization': 'Bearer ' + token})
+        self.assertEquals(response.status_code, 401)
+
+    def testInvalidToken(self):
+        token = self.getToken(self.test_admin.username)
+        response = self.c.get(reverse('api_post'), headers={'Authorization': 'Bearer ' + token + 'x'})
+        self.assertEquals(response.status_code, 401)
+        self.assertEquals(response.json()["message"], "invalid token")
+
+    @override_settings(API_TOKEN_MAX_AGE=-1)
+    def testExpiredToken(self):
+        token = self.getToken(self.test_admin.username)
+        response = self.c.get(reverse('api_post'), headers={'Authorization': 'Bearer ' + token})
+        self.assertEquals(response.status_code, 401)
+
+    @override_settings(API_TOKENS=False)
+    def testTokensDisabled(self):
+        body = {
+            "username": self.test_admin.username,
+            "password": ADMIN_PASSWORD,
+            "token": True
+        }
+        response = self.c.post(reverse('login'), body, content_type=CONTENT_JSON)
+        self.assertEquals(response.status_code, 400)
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+    def testSignedCookieSessionDoesNotQuerySession(self):
+        self.c = Client()
+        self.c.login(username=self.test_admin.username, password=ADMIN_PASSWORD)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.c.get(reverse('logout'))
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(len([query for query in queries if 'django_session' in query['sql']]), 0)
+
+
+
+class TestResponseCache(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_post = Post.objects.create(id=str(uuid.uuid4()),
+            title=TITLE,
+            content=CONTENT)
+
+    def setUp(self):
+        super().setUp()
+        self.c = Client()
+
+    def testRepeatedGetIsServedFromCache(self):
+        first = self.c.get(reverse('api_post'), {'size': '5', 'page': '1'})
+        with self.assertNumQueries(0):
+            second = self.c.get(reverse('api_post'), {'page': '1', 'size': '5'})
+        self.assertEquals(second.status_code, 200)
+        self.assertEquals(first.json(), second.json())
+
+    def testModelWritesInvalidateCache(self):
+        kwargs = {
+            "post_id": self.test_post.id
+        }
+        self.c.get(reverse('api_post'))
+        self.c.get(reverse('api_post_id', kwargs=kwargs))
+        self.test_post.title = "new title"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.test_post.save()
+        response = self.c.get(reverse('api_post_id', kwargs=kwargs))
+        self.assertEquals(response.json()["title"], "new title")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.test_post.delete()
+        response = self.c.get(reverse('api_post'))
+        self.assertEquals(response.json()["posts"], [])
+
+    def testAlbumWritesInvalidateCache(self):
+        self.c.get(reverse('api_album'))
+        with self.captureOnCommitCallbacks(execute=True):
+            Album.objects.create(id=str(uuid.uuid4()), title=TITLE, description=DESCRIPTION)
+        response = self.c.get(reverse('api_album'))
+        self.assertEquals(len(response.json()["albums"]), 1)
+
+    def testWorkersShareFileCacheGeneration(self):
+        # Two FileBasedCache instances on one directory stand in for two
+        # gunicorn workers.
+        with tempfile.TemporaryDirectory() as location:
+            api_cache = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}
+            with override_settings(CACHES={'api': api_cache}):
+                other_worker = FileBasedCache(location, {})
+                generation = get_generation(other_worker)
+                self.c.get(reverse('api_post'))
+                bump_generation()
+                self.assertNotEquals(get_generation(other_worker), generation)
+
+    def testInvalidationWaitsForCommit(self):
+        # A reader during the writer's transaction still sees the old rows,
+        # so it must not be able to cache them under the new generation.
+        self.c.get(reverse('api_post'))
+        cache = get_cache()
+        generation = cache.get(GENERATION_KEY)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.test_post.delete()
+        self.assertEquals(cache.get(GENERATION_KEY), generation)
+        self.assertEquals(len(callbacks), 1)
+        callbacks[0]()
+        self.assertNotEquals(cache.get(GENERATION_KEY), generation)
+        response = self.c.get(reverse('api_post'))
+        self.assertEquals(response.json()["posts"], [])
+
+
+@override_settings(CACHES={'api': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class TestConditionalGet(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_post = Post.objects.create(id=str(uuid.uuid4()),
+            title=TITLE,
+            content=CONTENT)
+        cls.test_album = Album.objects.create(id=str(uuid.uuid4()),
+            title=TITLE,
+            description=DESCRIPTION)
+
+    def setUp(self):
+        super().setUp()
+        self.c = Client()
+
+    def testListIfNoneMatch(self):
+        for url in (reverse('api_post'), reverse('api_album')):
+            response = self.c.get(url)
+            self.assertEquals(response.status_code, 200)
+            self.assertTrue(response.has_header('Last-Modified'))
+            with self.assertNumQueries(2):
+                response = self.c.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEquals(response.status_code, 304)
+            self.assertEquals(response.content, b'')
+
+    def testListEtagDependsOnQuery(self):
+        first = self.c.get(reverse('api_post'), {'page': '1'})
+        second = self.c.get(reverse('api_post'), {'page': '2'})
+        self.assertNotEquals(first['ETag'], second['ETag'])
+
+    def testDetailIfModifiedSince(self):
+        kwargs = {
+            "album_id": self.test_album.id
+        }
+        response = self.c.get(reverse('api_album_id', kwargs=kwargs))
+        response = self.c.get(reverse('api_album_id', kwargs=kwargs),
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEquals(response.status_code, 304)
+
+    def testAlbumDeleteChangesPostEtags(self):
+        post = Post.objects.create(id=str(uuid.uuid4()), title=TITLE, content=CONTENT, album=self.test_album)
+        urls = (reverse('api_post'), reverse('api_post_id', kwargs={"post_id": post.id}))
+        etags = [self.c.get(url)['ETag'] for url in urls]
+        self.test_album.delete()
+        for url, etag in zip(urls, etags):
+            response = self.c.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEquals(response.status_code, 200)
+        self.assertEquals(response.json()["album"], None)
+
+    def testWriteChangesEtag(self):
+        kwargs = {
+            "post_id": self.test_post.id
+        }
+        etags = [self.c.get(reverse('api_post'))['ETag'], self.c.get(reverse('api_post_id', kwargs=kwargs))['ETag']]
+        self.test_post.title = "new title"
+        self.test_post.save()
+        response = self.c.get(reverse('api_post'), HTTP_IF_NONE_MATCH=etags[0])
+        self.assertEquals(response.status_code, 200)
+        response = self.c.get(reverse('api_post_id', kwargs=kwargs), HTTP_IF_NONE_MATCH=etags[1])
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response.json()["title"], "new title")
+
+    def testDeleteChangesListEtag(self):
+        other_post = Post.objects.create(id=str(uuid.uuid4()), title=TITLE, content=CONTENT)
+        etag = self.c.get(reverse('api_post'))['ETag']
+        self.test_post.delete()
+        response = self.c.get(reverse('api_post'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals([post["id"] for post in response.json()["posts"]], [other_post.id])
+
+    def testMissingPostHasNoEtag(self):
+        kwargs = {
+            "post_id": INVALID_ID
+        }
+        response = self.c.get(reverse('api_post_id', kwargs=kwargs))
+        self.assertFalse(response.has_header('ETag'))
+
+
+class TestCachedConditionalGet(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Post.objects.create(id=str(uuid.uuid4()),
+            title=TITLE,
+            content=CONTENT)
+
+    def setUp(self):
+        super().setUp()
+        self.c = Client()
+
+    def testCachedIfNoneMatch(self):
+        response = self.c.get(reverse('api_post'))
+        with self.assertNumQueries(0):
+            response = self.c.get(reverse('api_post'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEquals(response.status_code, 304)
+
+
+
+@override_settings(API_SYNC_LAG=0)
+class TestSync(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.since = timezone.now()
+        cls.test_album = Album.objects.create(id=str(uuid.uuid4()),
+            title=TITLE,
+            description=DESCRIPTION)
+        cls.test_posts = [Post.objects.create(id=str(uuid.uuid4()),
+            title=TITLE,
+            content=CONTENT) for i in range(3)]
+
+    def setUp(self):
+        super().setUp()
+        self.c = Client()
+
+    def testSyncReturnsChangesAndDeletions(self):
+        deleted = sorted([("post", self.test_posts[0].id), ("album", self.test_album.id)])
+        self.test_posts[0].delete()
+        self.test_album.delete()
+        response = self.c.get(reverse('api_sync'), {'since': self.since.isoformat()})
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(len(response.json()["posts"]), 2)
+        self.assertEquals(response.json()["albums"], [])
+        self.assertEquals(sorted((tombstone["type"], tombstone["id"]) for tombstone in response.json()["deleted"]),
+            deleted)
+        self.assertFalse(response.json()["hasMore"])
+
+        response = self.c.get(reverse('api_sync'), {'since': response.json()["until"]})
+        self.assertEquals(response.json()["posts"], [])
+        self.assertEquals(response.json()["deleted"], [])
+
+    def testSyncOnlyReturnsChangesSince(self):
+        since = timezone.now()
+        self.test_posts[1].title = "new title"
+        self.test_posts[1].save()
+        response = self.c.get(reverse('api_sync'), {'since': since.isoformat()})
+        self.assertEquals([post["id"] for post in response.json()["posts"]], [self.test_posts[1].id])
+        self.assertEquals(response.json()["posts"][0]["title"], "new title")
+
+    def testSyncReturnsPostsOfDeletedAlbum(self):
+        album = Album.objects.create(id=str(uuid.uuid4()), title=TITLE, description=DESCRIPTION)
+        post = Post.objects.create(id=str(uuid.uuid4()), title=TITLE, content=CONTENT, album=album)
+        since = timezone.now()
+        album.delete()
+        response = self.c.get(reverse('api_sync'), {'since': since.isoformat()})
+        self.assertEquals([(item["id"], item["album"]) for item in response.json()["posts"]], [(post.id, None)])
+
+    def testSyncReturnsPostsOfDeletedUser(self):
+        user = User.objects.create_user('writer', password=ADMIN_PASSWORD)
+        post = Post.objects.create(id=str(uuid.uuid4()), title=TITLE, content=CONTENT, user=user)
+        since = timezone.now()
+        user.delete()
+        response = self.c.get(reverse('api_sync'), {'since': since.isoformat()})
+        self.assertEquals([item["id"] for item in response.json()["posts"]], [post.id])
+        self.assertNotEquals(response.json()["posts"][0]["user"], "writer")
+
+    @override_settings(API_SYNC_LAG=60)
+    def testSyncLagsBehindWrites(self):
+        since = timezone.now() - datetime.timedelta(minutes=5)
+        self.test_posts[1].save()
+        response = self.c.get(reverse('api_sync'), {'since': since.isoformat()})
+        self.assertEquals(response.json()["posts"], [])
+        until = parse_datetime(response.json()["until"])
+        self.assertTrue(until <= timezone.now() - datetime.timedelta(seconds=60))
+
+    def testSyncCursor(self):
+        ids = []
+        params = {'since': self.since.isoformat(), 'size': '1'}
+        while True:
+            response = self.c.get(reverse('api_sync'), params)
+            ids += [post["id"] for post in response.json()["posts"]]
+            if not response.json()["hasMore"]:
+                break
+            params = {'cursor': response.json()["nextCursor"], 'size': '1'}
+        self.assertEquals(ids, [post.id for post in self.test_posts])
+
+    def testSyncInvalidSince(self):
+        response = self.c.get(reverse('api_sync'), {'since': 'yesterday'})
+        self.assertEquals(response.status_code, 400)
+        response = self.c.get(reverse('api_sync'))
+        self.assertEquals(response.status_code, 400)
+        response = self.c.get(reverse('api_sync'), {'cursor': 'invalid cursor'})
+        self.assertEquals(response.status_code, 400)
+
+
+class AsyncUrls:
+    urlpatterns = [
+        path('api/post/', async_views.handle_post, name='api_post'),
+        path('api/album/', async_views.handle_album, name='api_album'),
+        path('api/post/<post_id>/', async_views.handle_post_by_id, name='api_post_id'),
+        path('api/album/<album_id>/', async_views.handle_album_by_id, name='api_album_id'),
+        path('api/export/', async_views.handle_export, name='api_export'),
+    ]
+
+
+@override_settings(ROOT_URLCONF=AsyncUrls,
+                   CACHES={'api': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class TestAsyncViews(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_album = Album.objects.create(id=str(uuid.uuid4()),
+            title=TITLE,
+            description=DESCRIPTION)
+        cls.test_posts = []
+        for i in range(3):
+            cls.test_posts.append(Post.objects.create(id=str(uuid.uuid4()),
+                title=TITLE,
+                content=CONTENT,
+                album=cls.test_album))
+        cls.test_posts.reverse()
+        cls.admin = User.objects.create_superuser(username="admin", password=ADMIN_PASSWORD)
+
+    async def testGetPosts(self):
+        response = await self.async_client.get(reverse('api_post'), {'page': '2', 'size': '2'})
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals([post["id"] for post in response.json()["posts"]],
+            [self.test_posts[2].id])
+        self.assertEquals(response.json()["page"], {"number": 2, "hasNext": False, "hasPrev": True,
+            "startIndex": 3, "endIndex": 3, "size": 2})
+        self.assertEquals(response.json()["posts"][0]["album"], self.test_album.id)
+
+    async def testGetPostsWithCursor(self):
+        response = await self.async_client.get(reverse('api_post'), {'cursor': '', 'size': '2'})
+        page = response.json()["page"]
+        self.assertEquals([post["id"] for post in response.json()["posts"]],
+            [post.id for post in self.test_posts[:2]])
+        response = await self.async_client.get(reverse('api_post'), {'cursor': page["nextCursor"], 'size': '2'})
+        self.assertEquals([post["id"] for post in response.json()["posts"]],
+            [self.test_posts[2].id])
+        self.assertFalse(response.json()["page"]["hasNext"])
+
+    async def testGetPostsWithInvalidCursor(self):
+        response = await self.async_client.get(reverse('api_post'), {'cursor': 'invalid cursor'})
+        self.assertEquals(response.status_code, 400)
+
+    async def testSearchPosts(self):
+        response = await self.async_client.get(reverse('api_post'), {'search': 'content'})
+        self.assertEquals(len(response.json()["posts"]), 3)
+        response = await self.async_client.get(reverse('api_post'), {'search': 'missing'})
+        self.assertEquals(len(response.json()["posts"]), 0)
+
+    async def testGetPost(self):
+        response = await self.async_client.get(reverse('api_post_id', args=[self.test_posts[0].id]))
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response.json()["id"], self.test_posts[0].id)
+        self.assertEquals(response.json()["title"], TITLE)
+        response = await self.async_client.get(reverse('api_post_id', args=[INVALID_ID]))
+        self.assertEquals(response.json(), {})
+
+    async def testGetAlbums(self):
+        response = await self.async_client.get(reverse('api_album'))
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals([album["id"] for album in response.json()["albums"]], [self.test_album.id])
+
+    async def testGetAlbum(self):
+        response = await self.async_client.get(reverse('api_album_id', args=[self.test_album.id]))
+        self.assertEquals(response.json()["description"], DESCRIPTION)
+        response = await self.async_client.get(reverse('api_album_id', args=[INVALID_ID]))
+        self.assertEquals(response.json(), {})
+
+    async def testIfNoneMatch(self):
+        response = await self.async_client.get(reverse('api_post'))
+        response = await self.async_client.get(reverse('api_post'),
+            headers={'If-None-Match': response['ETag']})
+        self.assertEquals(response.status_code, 304)
+        response = await self.async_client.get(reverse('api_album_id', args=[self.test_album.id]))
+        response = await self.async_client.get(reverse('api_album_id', args=[self.test_album.id]),
+            headers={'If-None-Match': response['ETag']})
+        self.assertEquals(response.status_code, 304)
+
+    async def testWritesUseSyncViews(self):
+        response = await self.async_client.post(reverse('api_post'), {"title": TITLE, "content": CONTENT},
+            content_type=CONTENT_JSON)
+        self.assertEquals(response.status_code, 401)
+        await sync_to_async(self.async_client.force_login)(self.admin)
+        response = await self.async_client.post(reverse('api_post'), {"title": TITLE, "content": CONTENT},
+            content_type=CONTENT_JSON)
+        self.assertEquals(response.status_code, 201)
+        response = await self.async_client.delete(reverse('api_album_id', args=[self.test_album.id]))
+        self.assertEquals(response.status_code, 200)
+        self.assertFalse(await Album.objects.filter(id=self.test_album.id).aexists())
+
+    async def testExport(self):
+        response = await self.async_client.get(reverse('api_export'))
+        self.assertEquals(response.status_code, 401)
+        await sync_to_async(self.async_client.force_login)(self.admin)
+        response = await self.async_client.get(reverse('api_export'))
+        content = b"".join([chunk async for chunk in response.streaming_content])
+        records = [json.loads(line) for line in content.decode().splitlines()]
+        self.assertEquals([record["type"] for record in records], ["album"] + ["post"] * 3)
+
+    async def testGetAlbumWithPosts(self):
+        response = await self.async_client.get(reverse('api_album_id', args=[self.test_album.id]),
+            {'include': 'posts', 'size': '2'})
+        self.assertEquals(response.json()["postCount"], 3)
+        self.assertEquals([post["id"] for post in response.json()["posts"]],
+            [post.id for post in self.test_posts[:2]])
+
+    async def testCachesInFileBackend(self):
+        with tempfile.TemporaryDirectory() as location:
+            api_cache = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}
+            with override_settings(CACHES={'api': api_cache}):
+                response = await self.async_client.get(reverse('api_post'))
+                other_worker = FileBasedCache(location, {})
+                self.assertIsNotNone(other_worker.get(GENERATION_KEY))
+                await Post.objects.filter(id=self.test_posts[0].id).aupdate(title="changed")
+                cached = await self.async_client.get(reverse('api_post'))
+                self.assertEquals(cached.content, response.content)
+
+    async def testGetPostsByIds(self):
+        ids = [self.test_posts[2].id, INVALID_ID, self.test_posts[0].id]
+        response = await self.async_client.get(reverse('api_post'), {'ids': ','.join(ids)})
+        self.assertEquals([post["id"] for post in response.json()["posts"]],
+            [self.test_posts[2].id, self.test_posts[0].id])
+
+
+class TestBulkPosts(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_admin = User.objects.create_superuser('test', password=ADMIN_PASSWORD)
+        cls.test_album = Album.objects.create(id=str(uuid.uuid4()),
+            title=TITLE,
+            description=DESCRIPTION)
+        cls.test_posts = []
+        for i in range(3):
+            cls.test_posts.append(Post.objects.create(id=str(uuid.uuid4()),
+                title=TITLE,
+                content=CONTENT,
+                user=cls.test_admin))
+
+    def setUp(self):
+        super().setUp()
+        self.c = Client()
+
+    def testBulkCreatePosts(self):
+        self.c.login(username=self.test_admin.username, password=ADMIN_PASSWORD)
+        body = [{
+            "title": TITLE,
+            "content": CONTENT,
+            "imageURLs": IMAGEURLS,
+            "videoURLs": VIDEOURLS,
+            "album": self.test_album.id
+        } for i in range(50)]
+        body.append({"title": TITLE, "content": CONTENT, "album": INVALID_ID})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.c.post(reverse('api_post_bulk'), body, content_type=CONTENT_JSON)
+        self.assertEquals(response.status_code, 201)
+        self.assertEquals(len([query for query in queries if query['sql'].startswith('INSERT')]), 1)
+        self.assertEquals(len([query for query in queries if 'FROM "api_album"' in query['sql']]), 1)
+        posts = response.json()["posts"]
+        self.assertEquals(len(posts), 51)
+        self.assertEquals(posts[0]["album"], self.test_album.id)
+        self.assertEquals(posts[0]["imageURLs"], IMAGEURLS)
+        self.assertEquals(posts[50]["album"], None)
+        self.assertEquals(Post.objects.filter(album=self.test_album, user=self.test_admin).count(), 50)
+
+    def testBulkCreateInvalidatesCache(self):
+        self.c.get(reverse('api_post'))
+        self.c.login(username=self.test_admin.username, password=ADMIN_PASSWORD)
+        self.c.post(reverse('api_post_bulk'), [{"title": TITLE, "content": CONTENT}], content_type=CONTENT_JSON)
+        response = self.c.get(reverse('api_post'))
+        self.assertEquals(len(response.json()["posts"]), 4)
+
+    def testUnauthenticatedBulkCreate(self):
+        response = self.c.post(reverse('api_post_bulk'), [{"title": TITLE, "content": CONTENT}],
+            content_type=CONTENT_JSON)
+        self.assertEquals(response.status_code, 401)
+
+    def testInvalidBulkCreate(self):
+        self.c.login(username=self.test_admin.username, password=ADMIN_PASSWORD)
+        for body in ([], {"title": TITLE, "content": CONTENT},
+                     [{"title": TITLE, "content": CONTENT}, {"title": TITLE}],
+                     [{"title": TITLE, "content": CONTENT, "imageURLs": IMAGEURL}]):
+            response = self.c.post(reverse('api_post_bulk'), body, content_type=CONTENT_JSON)
+            self.assertEquals(response.status_code, 400)
+        self.assertEquals(Post.objects.count(), 3)
+
+    def testBulkCreateIsAtomic(self):
+        self.c.login(username=self.test_admin.username, password=ADMIN_PASSWORD)
+        body = [{"title": TITLE, "content": CONTENT},
+                {"id": self.test_posts[0].id, "title": TITLE, "content": CONTENT}]
+        response = self.c.post(reverse('api_post_bulk'), body, content_type=CONTENT_JSON)
+        self.assertEquals(response.status_code, 400)
+        self.assertEquals(Post.objects.count(), 3)
+
+    def testGetPostsByIds(self):
+        ids = [self.test_posts[2].id, INVALID_ID, self.test_posts[0].id, self.test_posts[2].id]
+        # The two ETag aggregates and a single id__in query.
+        with self.assertNumQueries(3):
+            response = self.c.get(reverse('api_post'), {'ids': ','.join(ids)})
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals([post["id"] for post in response.json()["posts"]],
+            [self.test_posts[2].id, self.test_posts[0].id])
+
+    def testGetTooManyPostsByIds(self):
+        ids = [str(i) for i in range(101)]
+        response = self.c.get(reverse('api_post'), {'ids': ','.join(ids)})
+        self.assertEquals(response.status_code, 400)
+
+
+class TestExport(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_admin = User.objects.create_superuser('test', password=ADMIN_PASSWORD)
+        cls.test_album = Album.objects.create(id=str(uuid.uuid4()),
+            title=TITLE,
+            description=DESCRIPTION)
+        cls.test_posts = []
+        for i in range(5):
+            cls.test_posts.append(Post.objects.create(id=str(uuid.uuid4()),
+                title=TITLE,
+                content=CONTENT,
+                imageURLs=IMAGEURLS,
+                user=cls.test_admin,
+                album=cls.test_album))
+        Post.objects.create(id=str(uuid.uuid4()), title=TITLE, content=CONTENT)
+
+    def setUp(self):
+        super().setUp()
+        self.c = Client()
+
+    def testExport(self):
+        self.c.login(username=self.test_admin.username, password=ADMIN_PASSWORD)
+        response = self.c.get(reverse('api_export'))
+        self.assertEquals(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEquals(response['Content-Type'], "application/x-ndjson")
+        records = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEquals([record["type"] for record in records], ["album"] + ["post"] * 6)
+        self.assertEquals(records[0]["id"], self.test_album.id)
+        self.assertEquals([record["id"] for record in records[1:6]], [post.id for post in self.test_posts])
+        self.assertEquals(records[1]["user"], self.test_admin.username)
+        self.assertEquals(records[1]["album"], self.test_album.id)
+        self.assertEquals(records[1]["imageURLs"], IMAGEURLS)
+        self.assertEquals(records[6]["user"], None)
+
+    def testUnauthenticatedExport(self):
+        response = self.c.get(reverse('api_export'))
+        self.assertEquals(response.status_code, 401)
+
+    def testExportCommand(self):
+        output = io.StringIO()
+        call_command('export_blog', chunk_size=2, stdout=output)
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEquals(len(records), 7)
+        self.assertEquals(records[-1]["type"], "post")
+
+
+class TestImport(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_admin = User.objects.create_superuser('test', password=ADMIN_PASSWORD)
+        cls.test_album = Album.objects.create(id=str(uuid.uuid4()),
+            title=TITLE,
+            description=DESCRIPTION)
+        for i in range(5):
+            Post.objects.create(id=str(uuid.uuid4()),
+                title=TITLE,
+                content=CONTENT,
+                imageURLs=IMAGEURLS,
+                user=cls.test_admin,
+                album=cls.test_album)
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-8') as output:
+            output.write(content)
+        return path
+
+    def importBlog(self, *args, **options):
+        output = io.StringIO()
+        call_command('import_blog', *args, stdout=output, **options)
+        return output.getvalue()
+
+    def testRoundTrip(self):
+        export = io.StringIO()
+        call_command('export_blog', stdout=export)
+        posts = {post.id: post for post in Post.objects.all()}
+        Post.objects.all().delete()
+        Album.objects.all().delete()
+        for options in ({'batch_size': 2}, {'batch_size': 2, 'copy': True}):
+            output = self.importBlog(self.write('blog.ndjson', export.getvalue()), **options)
+            self.assertIn("Imported 1 albums and 5 posts", output)
+            self.assertIn("rows/s", output)
+            self.assertEquals(Post.objects.count(), 5)
+            for post in Post.objects.all():
+                self.assertEquals(post.created, posts[post.id].created)
+                self.assertEquals(post.imageURLs, IMAGEURLS)
+                self.assertEquals(post.user_id, self.test_admin.id)
+                self.assertEquals(post.album_id, self.test_album.id)
+            self.assertEquals(Album.objects.get().description, DESCRIPTION)
+
+    def testUpsert(self):
+        post = Post.objects.first()
+        records = [
+            {"type": "post", "id": post.id, "title": "new title", "content": CONTENT, "album": INVALID_ID},
+            {"type": "post", "id": "new", "title": TITLE, "content": "one\ttwo\nthree \\ \"four\"",
+             "videoURLs": ['a "quoted" \\ url']},
+        ]
+        content = "".join(json.dumps(record) + "\n" for record in records)
+        for options in ({}, {'copy': True}):
+            self.importBlog(self.write('posts.ndjson', content), **options)
+            self.assertEquals(Post.objects.count(), 6)
+            post.refresh_from_db()
+            self.assertEquals(post.title, "new title")
+            self.assertEquals(post.album_id, None)
+            self.assertEquals(post.user_id, None)
+            self.assertGreater(post.updated, post.created)
+            new = Post.objects.get(id="new")
+            self.assertEquals(new.content, records[1]["content"])
+            self.assertEquals(new.videoURLs, records[1]["videoURLs"])
+            self.assertTrue(Post.objects.filter(search_vector="three").exists())
+
+    def testCsv(self):
+        content = ("id,title,content,imageURLs,user,album,created\n"
+                   "a,%s,%s,\"[\"\"%s\"\"]\",test,%s,2021-05-03T07:20:26Z\n"
+                   "b,%s,%s,,,,\n") % (TITLE, CONTENT, IMAGEURL, self.test_album.id, TITLE, CONTENT)
+        self.importBlog(self.write('posts.csv', content), type='post')
+        post = Post.objects.get(id="a")
+        self.assertEquals(post.imageURLs, [IMAGEURL])
+        self.assertEquals(post.user_id, self.test_admin.id)
+        self.assertEquals(post.album_id, self.test_album.id)
+        self.assertEquals(post.created.year, 2021)
+        self.assertEquals(Post.objects.get(id="b").imageURLs, [])
+
+    def testInvalidRecord(self):
+        path = self.write('posts.ndjson', json.dumps({"type": "post", "title": TITLE}) + "\n")
+        with self.assertRaisesMessage(CommandError, "line 1"):
+            self.importBlog(path)
+        path = self.write('posts.csv', "title,content\n%s,%s\n" % (TITLE, CONTENT))
+        with self.assertRaises(CommandError):
+            self.importBlog(path)
+
+    def testFailedImportInvalidatesCache(self):
+        records = [
+            {"type": "post", "id": "first", "title": TITLE, "content": CONTENT},
+            {"type": "post", "title": TITLE},
+        ]
+        path = self.write('posts.ndjson', "".join(json.dumps(record) + "\n" for record in records))
+        generation = get_generation(get_cache())
+        with self.assertRaisesMessage(CommandError, "line 2"):
+            self.importBlog(path, batch_size=1)
+        self.assertTrue(Post.objects.filter(id="first").exists())
+        self.assertNotEquals(get_generation(get_cache()), generation)
+
+
+class TestResponseEncoder(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_post = Post.objects.create(id=str(uuid.uuid4()),
+            title="tëst title ✓",
+            content=CONTENT,
+            imageURLs=IMAGEURLS,
+            videoURLs=VIDEOURLS)
+
+    def setUp(self):
+        super().setUp()
+        self.c = Client()
+
+    def testEncodersMatch(self):
+        created = timezone.now().replace(microsecond=123456)
+        data = {"posts": [{"title": "tëst ✓ \"quoted\"\n", "created": created, "created2": created.replace(microsecond=0),
+                           "imageURLs": IMAGEURLS, "album": None, "count": 3, "hasNext": True}]}
+        encoded = responses.encode_json(data)
+        self.assertIn(b'"created":"%s.123456Z"' % created.strftime("%Y-%m-%dT%H:%M:%S").encode(), encoded)
+        self.assertIn(b'"created2":"%sZ"' % created.strftime("%Y-%m-%dT%H:%M:%S").encode(), encoded)
+        self.assertEquals(json.loads(encoded)["posts"][0]["title"], data["posts"][0]["title"])
+        if responses.orjson is not None:
+            self.assertEquals(responses.encode_orjson(data), encoded)
+
+    @override_settings(CACHES={'api': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+    def testResponsesMatch(self):
+        contents = []
+        for encoder in ('json', 'orjson') if responses.orjson is not None else ('json',):
+            with self.settings(API_JSON_ENCODER=encoder):
+                response = self.c.get(reverse('api_post'))
+            self.assertEquals(response['Content-Type'], "application/json")
+            contents.append(response.content)
+        self.assertEquals(len(set(contents)), 1)
+        self.assertEquals(response.json()["posts"][0]["title"], self.test_post.title)
+        self.assertTrue(response.json()["posts"][0]["created"].endswith("Z"))
+
+    @override_settings(API_JSON_ENCODER='yaml')
+    def testUnknownEncoder(self):
+        with self.assertRaises(ImproperlyConfigured):
+            responses.encode({})
+
+
+@override_settings(CACHES={'api': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class TestSparseFields(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_admin = User.objects.create_superuser('test', password=ADMIN_PASSWORD)
+        cls.test_album = Album.objects.create(id=str(uuid.uuid4()),
+            title=TITLE,
+            description=DESCRIPTION * 10)
+        cls.test_post = Post.objects.create(id=str(uuid.uuid4()),
+            title=TITLE,
+            content=CONTENT * 100,
+            imageURLs=IMAGEURLS,
+            videoURLs=VIDEOURLS,
+            user=cls.test_admin,
+            album=cls.test_album)
+
+    def setUp(self):
+        super().setUp()
+        self.c = Client()
+
+    def getPosts(self, params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.c.get(reverse('api_post'), params)
+        return response, queries[-1]['sql']
+
+    def testFields(self):
+        response, sql = self.getPosts({'fields': 'id,title,created,imageURLs'})
+        self.assertEquals(response.status_code, 200)
+        post = response.json()["posts"][0]
+        self.assertEquals(list(post), ["id", "title", "created", "imageURLs"])
+        self.assertEquals(post["imageURLs"], IMAGEURLS)
+        self.assertNotIn('"api_post"."content"', sql)
+        self.assertNotIn('"videoURLs"', sql)
+        self.assertNotIn('auth_user', sql)
+
+    def testFieldsWithUser(self):
+        response, sql = self.getPosts({'fields': 'title,user,album', 'cursor': ''})
+        self.assertEquals(response.json()["posts"], [{"title": TITLE, "user": self.test_admin.username,
+                                                      "album": self.test_album.id}])
+        self.assertIsNotNone(response.json()["page"]["size"])
+        self.assertIn('auth_user', sql)
+
+    def testExcerpt(self):
+        response, sql = self.getPosts({'excerpt': '20'})
+        post = response.json()["posts"][0]
+        self.assertEquals(post["content"], (CONTENT * 100)[:20])
+        self.assertEquals(post["videoURLs"], VIDEOURLS)
+        self.assertIn('SUBSTRING("api_post"."content", 1, 20)', sql)
+        self.assertEquals(sql.count('"api_post"."content"'), 1)
+
+    def testFieldsAndExcerptWithSearch(self):
+        response, sql = self.getPosts({'fields': 'id,content', 'excerpt': '5', 'search': 'content'})
+        self.assertEquals(response.json()["posts"], [{"id": self.test_post.id, "content": CONTENT[:5]}])
+
+    def testFieldsWithIds(self):
+        response, sql = self.getPosts({'fields': 'id,title', 'ids': self.test_post.id})
+        self.assertEquals(response.json()["posts"], [{"id": self.test_post.id, "title": TITLE}])
+        self.assertNotIn('"api_post"."content"', sql)
+
+    def testInvalidFields(self):
+        for params in ({'fields': 'id,password'}, {'fields': ','}, {'excerpt': '0'}, {'excerpt': 'ten'}):
+            response = self.c.get(reverse('api_post'), params)
+            self.assertEquals(response.status_code, 400)
+        self.assertEquals(response.json()["message"], "invalid excerpt")
+
+    def testExcerptLimit(self):
+        response = self.c.get(reverse('api_post'), {'excerpt': '100000'})
+        self.assertEquals(response.status_code, 200)
+        for excerpt in ('100001', '2147483648'):
+            response = self.c.get(reverse('api_post'), {'excerpt': excerpt})
+            self.assertEquals(response.status_code, 400)
+            self.assertEquals(response.json()["message"], "invalid excerpt")
+            response = self.c.get(reverse('api_album'), {'excerpt': excerpt})
+            self.assertEquals(response.status_code, 400)
+
+    def testAlbumFields(self):
+        response = self.c.get(reverse('api_album'), {'fields': 'id,description', 'excerpt': '4'})
+        self.assertEquals(response.json()["albums"], [{"id": self.test_album.id, "description": DESCRIPTION[:4]}])
+
+
+@override_settings(CACHES={'api': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class TestAlbumPosts(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_album = Album.objects.create(id=str(uuid.uuid4()),
+            title=TITLE,
+            description=DESCRIPTION)
+        cls.test_posts = []
+        for i in range(5):
+            cls.test_posts.append(Post.objects.create(id=str(uuid.uuid4()),
+                title=TITLE,
+                content=CONTENT,
+                album=cls.test_album))
+        cls.test_posts.reverse()
+        Post.objects.create(id=str(uuid.uuid4()), title=TITLE, content=CONTENT)
+
+    def setUp(self):
+        super().setUp()
+        self.c = Client()
+        self.kwargs = {
+            "album_id": self.test_album.id
+        }
+
+    def testGetAlbumWithPosts(self):
+        response = self.c.get(reverse('api_album_id', kwargs=self.kwargs), {'include': 'posts', 'size': '2', 'page': '2'})
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response.json()["id"], self.test_album.id)
+        self.assertEquals(response.json()["postCount"], 5)
+        self.assertEquals(response.json()["page"]["number"], 2)
+        self.assertEquals(response.json()["page"]["endIndex"], 4)
+        self.assertEquals([post["id"] for post in response.json()["posts"]],
+            [post.id for post in self.test_posts[2:4]])
+
+    def testGetAlbumWithPostsQueryCount(self):
+        for size in ('1', '5'):
+            # The ETag's album, post and tombstone timestamps, then the album,
+            # the post count and the page.
+            with self.assertNumQueries(6):
+                response = self.c.get(reverse('api_album_id', kwargs=self.kwargs), {'include': 'posts', 'size': size})
+            self.assertEquals(len(response.json()["posts"]), int(size))
+        with self.assertNumQueries(6):
+            response = self.c.get(reverse('api_album_id', kwargs=self.kwargs),
+                {'include': 'posts', 'cursor': '', 'fields': 'id,title'})
+        self.assertEquals(response.json()["posts"][0], {"id": self.test_posts[0].id, "title": TITLE})
+        self.assertTrue(response.json()["page"]["hasNext"] is False)
+
+    def testGetAlbumWithoutPosts(self):
+        response = self.c.get(reverse('api_album_id', kwargs=self.kwargs))
+        self.assertNotIn("posts", response.json())
+
+    def testInvalidInclude(self):
+        response = self.c.get(reverse('api_album_id', kwargs=self.kwargs), {'include': 'users'})
+        self.assertEquals(response.status_code, 400)
+
+    def testPostChangesMoveEtag(self):
+        url = reverse('api_album_id', kwargs=self.kwargs)
+        etag = self.c.get(url, {'include': 'posts'})['ETag']
+        self.assertEquals(self.c.get(url, {'include': 'posts'}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.test_posts[0].album = None
+        self.test_posts[0].save()
+        response = self.c.get(url, {'include': 'posts'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response.json()["postCount"], 4)
+        etag = response['ETag']
+        self.test_posts[1].delete()
+        response = self.c.get(url, {'include': 'posts'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.json()["postCount"], 3)
+
+
+@override_settings(CACHES={'api': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class TestMetrics(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_admin = User.objects.create_superuser('test', password=ADMIN_PASSWORD)
+        cls.test_user = User.objects.create_user('user', password=ADMIN_PASSWORD)
+        cls.test_post = Post.objects.create(id=str(uuid.uuid4()),
+            title=TITLE,
+            content=CONTENT)
+
+    def setUp(self):
+        super().setUp()
+        self.c = Client()
+        metrics.registry.reset()
+
+    def testRecordsRequests(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.c.get(reverse('api_post'))
+        self.assertEquals(response.status_code, 200)
+        query_count = len(queries)
+        self.c.delete(reverse('api_post_id', kwargs={"post_id": self.test_post.id}))
+        self.c.force_login(self.test_admin)
+        text = self.c.get(reverse('api_metrics')).content.decode()
+        pid = os.getpid()
+        self.assertIn('api_requests_total{pid="%d",view="api_post",method="GET",status="200"} 1' % pid, text)
+        self.assertIn('api_requests_total{pid="%d",view="api_post_id",method="DELETE",status="401"} 1' % pid, text)
+        self.assertIn('api_request_queries_sum{pid="%d",view="api_post",method="GET"} %d' % (pid, query_count), text)
+        self.assertIn('api_response_size_bytes_sum{pid="%d",view="api_post",method="GET"} %d' % (
+            pid, len(response.content)), text)
+        self.assertIn('api_request_duration_seconds_count{pid="%d",view="api_post",method="GET"} 1' % pid, text)
+
+    def testMetricsRequiresStaff(self):
+        response = self.c.get(reverse('api_metrics'))
+        self.assertEquals(response.status_code, 401)
+        self.c.force_login(self.test_user)
+        response = self.c.get(reverse('api_metrics'))
+        self.assertEquals(response.status_code, 401)
+
+    @override_settings(API_SLOW_REQUEST_QUERIES=1)
+    def testLogsSlowRequests(self):
+        with self.assertLogs('api.metrics', level='WARNING') as logs:
+            self.c.get(reverse('api_post'))
+        self.assertIn('slow request GET /api/post/ (api_post) 200', logs.output[0])
+        self.assertIn('FROM "api_post"', logs.output[0])
+
+    @override_settings(ROOT_URLCONF=AsyncUrls)
+    async def testRecordsAsyncViewQueries(self):
+        response = await self.async_client.get(reverse('api_post'))
+        self.assertEquals(response.status_code, 200)
+        text = metrics.registry.render()
+        pid = os.getpid()
+        self.assertIn('api_requests_total{pid="%d",view="api_post",method="GET",status="200"} 1' % pid, text)
+        self.assertNotIn('api_request_queries_sum{pid="%d",view="api_post",method="GET"} 0\n' % pid, text)
+
+    def testFastRequestsAreNotLogged(self):
+        with self.assertNoLogs('api.metrics', level='WARNING'):
+            self.c.get(reverse('api_post'))
+
+
+class TestProfiler(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_admin = User.objects.create_superuser('test', password=ADMIN_PASSWORD)
+        cls.test_user = User.objects.create_user('user', password=ADMIN_PASSWORD)
+
+    def setUp(self):
+        super().setUp()
+        self.profile_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.profile_dir.cleanup)
+        profiler_settings = self.settings(API_PROFILER=True, API_PROFILER_DIR=self.profile_dir.name)
+        profiler_settings.enable()
+        self.addCleanup(profiler_settings.disable)
+        self.c = Client()
+
+    def testStaffHeaderProfilesRequest(self):
+        self.c.force_login(self.test_admin)
+        response = self.c.get(reverse('api_post'), {'search': TITLE}, headers={'X-Profile': '1'})
+        self.assertEquals(response.status_code, 200)
+        name = response['X-Profile']
+        self.assertEquals(os.listdir(self.profile_dir.name), [name])
+        self.assertIn('api_post', name)
+        self.assertEquals(self.c.get(reverse('api_profiles')).json()["profiles"], [name])
+        response = self.c.get(reverse('api_profile', kwargs={"name": name}))
+        self.assertEquals(response.status_code, 200)
+        stats = os.path.join(self.profile_dir.name, "download.pstats")
+        with open(stats, 'wb') as f:
+            f.write(b"".join(response.streaming_content))
+        self.assertTrue(any(function[2] == 'handle_post_search' for function in pstats.Stats(stats).stats))
+
+    def testNonStaffHeaderIsIgnored(self):
+        self.c.force_login(self.test_user)
+        response = self.c.get(reverse('api_post'), headers={'X-Profile': '1'})
+        self.assertNotIn('X-Profile', response)
+        self.assertEquals(os.listdir(self.profile_dir.name), [])
+
+    @override_settings(API_PROFILER_SAMPLE_RATE=1, API_PROFILER_MAX_FILES=2)
+    def testSampledRequestsKeepNewestProfiles(self):
+        for _ in range(3):
+            self.assertIn('X-Profile', self.c.get(reverse('api_post')))
+        self.assertEquals(len(os.listdir(self.profile_dir.name)), 2)
+
+    def testProfilesRequireStaff(self):
+        self.assertEquals(self.c.get(reverse('api_profiles')).status_code, 401)
+        self.c.force_login(self.test_user)
+        self.assertEquals(self.c.get(reverse('api_profile', kwargs={"name": "x.pstats"})).status_code, 401)
+
+    def testUnknownProfile(self):
+        self.c.force_login(self.test_admin)
+        for name in ("missing.pstats", "..", "settings.py"):
+            response = self.c.get(reverse('api_profile', kwargs={"name": name}))
+            self.assertEquals(response.status_code, 404)
+
+    @override_settings(API_PROFILER=False)
+    def testDisabledProfilerIsNotLoaded(self):
+        self.c.force_login(self.test_admin)
+        response = self.c.get(reverse('api_post'), headers={'X-Profile': '1'})
+        self.assertNotIn('X-Profile', response)
+        with self.assertRaises(MiddlewareNotUsed):
+            ProfilerMiddleware(lambda request: None)
+
+
+class TestBenchSuite(ApiTestCase):
+    def testRunsEveryScenario(self):
+        staff = suite.seed(30, 2)
+        results = suite.run(staff, repeat=2, warmup=1)
+        self.assertEquals(len(results), 13)
+        for result in results.values():
+            self.assertEquals(set(result), {"p50", "p95", "p99", "queries"})
+            self.assertTrue(result["queries"] > 0)
+        self.assertEquals(Post.objects.filter(title="doomed").count(), 0)
+
+    def testCompare(self):
+        baseline = {
+            "feed first page": {"p50": 10, "queries": 4},
+            "post detail": {"p50": 10, "queries": 2},
+            "post edit": {"p50": 10, "queries": 4},
+        }
+        results = {
+            "feed first page": {"p50": 11, "queries": 4},
+            "post detail": {"p50": 13, "queries": 2},
+            "post edit": {"p50": 9, "queries": 5},
+            "post create": {"p50": 9, "queries": 3},
+        }
+        rows, regressions = suite.compare(baseline, results, threshold=20)
+        self.assertEquals([row[0] for row in rows], ["feed first page", "post detail", "post edit"])
+        self.assertEquals(regressions, ["post detail", "post edit"])
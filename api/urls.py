@@ -1,12 +1,22 @@
+from django.conf import settings
 from django.urls import path
 
-from . import views
+from . import async_views, views
+
+# Read endpoints are served by their coroutine versions under ASGI.
+read_views = async_views if settings.ASYNC_VIEWS else views
 
 urlpatterns = [
     path('login/', views.handle_login, name='login'),
     path('logout/', views.handle_logout, name='logout'),
-    path('post/', views.handle_post, name='api_post'),
-    path('album/', views.handle_album, name='api_album'),
-    path('post/<post_id>/', views.handle_post_by_id, name='api_post_id'),
-    path('album/<album_id>/', views.handle_album_by_id, name='api_album_id'),
+    path('post/', read_views.handle_post, name='api_post'),
+    path('album/', read_views.handle_album, name='api_album'),
+    path('post/bulk/', views.handle_post_bulk, name='api_post_bulk'),
+    path('post/<post_id>/', read_views.handle_post_by_id, name='api_post_id'),
+    path('album/<album_id>/', read_views.handle_album_by_id, name='api_album_id'),
+    path('sync/', views.handle_sync, name='api_sync'),
+    path('export/', read_views.handle_export, name='api_export'),
+    path('metrics/', views.handle_metrics, name='api_metrics'),
+    path('profiles/', views.handle_profiles, name='api_profiles'),
+    path('profiles/<name>/', views.handle_profile, name='api_profile'),
 ]
\ No newline at end of file
@@ -1,17 +1,29 @@
+from django.conf import settings
 from django.shortcuts import render, redirect
-from django.contrib.auth.models import User
 from django.contrib.auth import authenticate, login, logout
-from django.http import HttpResponse
+from django.http import FileResponse, HttpResponse
 from django.contrib.auth.forms import AuthenticationForm
-from .models import Post, Album
+from .models import Post, Album, Tombstone
+from .cache import bump_generation, cache_response, conditional_response, make_etag
+from .export import export_chunks
+from .metrics import registry
+from .profiler import list_profiles, profile_path
+from .responses import JsonResponse
+from .tokens import create_token, get_current_user
+import datetime
 import json
-from django.http.response import JsonResponse
+from django.http.response import StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.paginator import Paginator
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 from django.db.utils import DataError
-from django.db.models import Q
+from django.db.models import F, Max, Q
+from django.db.models.functions import Greatest, Substr
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 import uuid
 
 NOT_AUTH = "not authenticated"
@@ -19,6 +31,29 @@ POST_CREATE_DENY = "could not create post"
 ALBUM_CREATE_DENY = "could not create album"
 POST_UPDATE_DENY = "could not update post"
 ALBUM_UPDATE_DENY = "could not update album"
+INVALID_CURSOR = "invalid cursor"
+INVALID_SINCE = "invalid since"
+INVALID_FIELDS = "invalid fields"
+INVALID_EXCERPT = "invalid excerpt"
+INVALID_INCLUDE = "invalid include"
+TOKENS_DISABLED = "token login disabled"
+TOKEN_LOGOUT = "tokens cannot be revoked"
+PROFILE_NOT_FOUND = "profile not found"
+TOO_MANY_IDS = "too many ids"
+MAX_IDS = 100
+MAX_EXCERPT = 100000
+MAX_BULK_SIZE = 1000
+SYNC_SIZE = 100
+MAX_SYNC_SIZE = 1000
+SEARCH_CONFIG = "english"
+EXPORT_FILENAME = "thetogetherblog.ndjson"
+# Columns emitted by create_post_response/create_album_response, list and
+# detail queries load nothing else.
+POST_FIELDS = ('id', 'user__username', 'title', 'content', 'created', 'updated', 'imageURLs', 'videoURLs', 'album')
+ALBUM_FIELDS = ('id', 'title', 'description', 'imageURL', 'created', 'updated')
+# Keys a list request can pick with ?fields=.
+POST_RESPONSE_FIELDS = ('id', 'user', 'title', 'content', 'created', 'imageURLs', 'videoURLs', 'album')
+ALBUM_RESPONSE_FIELDS = ('id', 'title', 'description', 'imageURL', 'created')
 
 @csrf_exempt
 def handle_login(request):
@@ -33,6 +68,14 @@ def handle_login(request):
         username = body['username']
         password = body['password']
         user = authenticate(request, username=username, password=password)
+        if user is not None and body.get('token') is True:
+            if not settings.API_TOKENS:
+                return JsonResponse({"message":TOKENS_DISABLED}, status=400)
+            response = {
+                "message": "user logged in",
+                "token": create_token(user)
+            }
+            return JsonResponse(response, status=200)
         if user is not None:
             login(request, user)
             response = {
@@ -56,6 +99,10 @@ def handle_logout(request):
         }
         return JsonResponse(response, status=401)
     if request.method != "DELETE":
+        if request.headers.get('Authorization', '').startswith('Bearer '):
+            # A bearer token stays valid until it expires, logging out
+            # would only pretend otherwise.
+            return JsonResponse({"message":TOKEN_LOGOUT}, status=400)
         logout(request)
         response = {
             "message": "user logged out"
@@ -67,22 +114,23 @@ def handle_logout(request):
     return JsonResponse(response, status=405)
 
 def check_staff(request):
-    try:
-        current_user = request.user
-        User.objects.get(username=current_user, is_staff=True) 
-        return True
-    except ObjectDoesNotExist:
-        return False
+    # AuthenticationMiddleware already loaded request.user (once, lazily), so
+    # authorization never needs another query. A bearer token only carries
+    # the staff flag it was issued with, so its user is reloaded once.
+    if getattr(request, 'token_user', False):
+        user = get_current_user(request.user)
+
+        async def auser():
+            return user
+        request.user = user
+        request.auser = auser
+        request.token_user = False
+    return request.user.is_authenticated and request.user.is_staff
 
 def check_login(request):
-    try:
-        current_user = request.user
-        User.objects.get(username=current_user) 
-        return True
-    except ObjectDoesNotExist:
-        return False
+    return request.user.is_authenticated
 
-def handle_page(request, objects):
+def get_page_params(request):
     page = 1
     size = 10
     try:
@@ -92,35 +140,186 @@ def handle_page(request, objects):
             size = int(request.GET.get('size'))
     except ValueError:
         pass
+    return page, size
+
+def handle_page(request, objects, count=None):
+    page, size = get_page_params(request)
+    if 'cursor' in request.GET:
+        return handle_cursor_page(request.GET.get('cursor'), objects, size)
     paginator = Paginator(objects, size)
-    return paginator.get_page(page), size
+    if count is not None:
+        # Paginator.count is a cached_property, a known count saves the COUNT(*).
+        paginator.count = count
+    page_obj = paginator.get_page(page)
+    return page_obj.object_list, create_page_response(page_obj, size)
+
+def create_page_response(page_obj, size):
+    return {
+        "number": page_obj.number,
+        "hasNext": page_obj.has_next(),
+        "hasPrev": page_obj.has_previous(),
+        "startIndex": page_obj.start_index(),
+        "endIndex": page_obj.end_index(),
+        "size": size
+    }
+
+def handle_cursor_page(cursor, objects, size):
+    objects, direction, size = cursor_queryset(cursor, objects, size)
+    return create_cursor_page(list(objects), cursor, direction, size)
+
+def cursor_queryset(cursor, objects, size):
+    # Keyset pagination on (created, id): every page is an index range scan
+    # of at most size + 1 rows and no COUNT(*) is issued.
+    size = max(size, 1)
+    direction = "next"
+    objects = objects.order_by('-created', '-id')
+    if cursor:
+        direction, created, object_id = decode_cursor(cursor)
+        # The OR alone is no index condition, the redundant bound on created
+        # starts the range scan at the cursor instead of at the newest row.
+        if direction == "next":
+            objects = objects.filter(Q(created__lt=created) |
+                                     Q(created=created, id__lt=object_id),
+                                     created__lte=created)
+        else:
+            objects = objects.filter(Q(created__gt=created) |
+                                     Q(created=created, id__gt=object_id),
+                                     created__gte=created
+                                     ).order_by('created', 'id')
+    return objects[:size + 1], direction, size
+
+def create_cursor_page(object_list, cursor, direction, size):
+    has_more = len(object_list) > size
+    object_list = object_list[:size]
+    if direction == "next":
+        has_next, has_prev = has_more, bool(cursor)
+    else:
+        object_list.reverse()
+        has_next, has_prev = True, has_more
+    next_cursor = None
+    prev_cursor = None
+    if object_list and has_next:
+        next_cursor = encode_cursor(object_list[-1], "next")
+    if object_list and has_prev:
+        prev_cursor = encode_cursor(object_list[0], "prev")
+    return object_list, {
+        "hasNext": has_next,
+        "hasPrev": has_prev,
+        "nextCursor": next_cursor,
+        "prevCursor": prev_cursor,
+        "size": size
+    }
+
+def encode_cursor(obj, direction):
+    value = json.dumps([direction, obj.created.isoformat(), obj.id])
+    return urlsafe_base64_encode(value.encode())
+
+def decode_cursor(cursor):
+    try:
+        direction, created, object_id = json.loads(urlsafe_base64_decode(cursor))
+        created = parse_datetime(created)
+    except (ValueError, TypeError):
+        raise ValueError(INVALID_CURSOR)
+    if direction not in ("next", "prev") or created is None or not isinstance(object_id, str):
+        raise ValueError(INVALID_CURSOR)
+    return direction, created, object_id
+
+def handle_post_fields(request, objects):
+    return handle_fields(request, objects, POST_RESPONSE_FIELDS, 'content', create_post_response)
+
+def handle_album_fields(request, objects):
+    return handle_fields(request, objects, ALBUM_RESPONSE_FIELDS, 'description', create_album_response)
+
+def handle_fields(request, objects, response_fields, text_field, create_response):
+    # ?fields= and ?excerpt= narrow the columns the list query loads, so
+    # unrequested fields and long text never leave Postgres.
+    fields, excerpt = get_fields_params(request, response_fields)
+    if fields == response_fields and excerpt is None:
+        return objects, create_response
+    columns = ['id', 'created']
+    for field in fields:
+        if field == 'user':
+            columns.append('user__username')
+        elif field != text_field or excerpt is None:
+            columns.append(field)
+    if 'user' not in fields:
+        objects = objects.select_related(None)
+    objects = objects.only(*columns)
+    if excerpt is not None and text_field in fields:
+        objects = objects.annotate(excerpt=Substr(text_field, 1, excerpt))
+    return objects, lambda obj: create_sparse_response(obj, fields, text_field, excerpt)
+
+def get_fields_params(request, response_fields):
+    fields = response_fields
+    excerpt = None
+    if 'fields' in request.GET:
+        fields = tuple(dict.fromkeys(field.strip() for field in request.GET.get('fields').split(',') if field.strip()))
+        if not fields or any(field not in response_fields for field in fields):
+            raise ValueError(INVALID_FIELDS)
+    if 'excerpt' in request.GET:
+        try:
+            excerpt = int(request.GET.get('excerpt'))
+        except ValueError:
+            raise ValueError(INVALID_EXCERPT)
+        if not 1 <= excerpt <= MAX_EXCERPT:
+            raise ValueError(INVALID_EXCERPT)
+    return fields, excerpt
+
+def create_sparse_response(obj, fields, text_field, excerpt):
+    response = {}
+    for field in fields:
+        if field == "user":
+            response[field] = str(obj.user)
+        elif field == "album":
+            response[field] = obj.album_id
+        elif field == text_field and excerpt is not None:
+            response[field] = obj.excerpt
+        else:
+            response[field] = getattr(obj, field)
+    return response
 
+def list_validator(model, kind):
+    # Any write to the table moves its newest updated timestamp and any
+    # delete its newest tombstone, and with them every list ETag. Both maxima
+    # are read from the end of an index instead of counting the table.
+    def validator(request):
+        updated = model.objects.aggregate(updated=Max('updated'))["updated"]
+        deleted = Tombstone.objects.filter(kind=kind).aggregate(deleted=Max('deleted'))["deleted"]
+        return list_etag(request, updated, deleted)
+    return validator
+
+def list_etag(request, updated, deleted):
+    timestamps = [timestamp for timestamp in (updated, deleted) if timestamp is not None]
+    if not timestamps:
+        return None, None
+    return make_etag(request.get_full_path(), updated, deleted), max(timestamps)
+
+def detail_validator(model, lookup):
+    def validator(request, **kwargs):
+        updated = model.objects.filter(id=kwargs[lookup]).values_list('updated', flat=True).first()
+        return detail_etag(request, updated)
+    return validator
+
+def detail_etag(request, updated):
+    if updated is None:
+        return None, None
+    return make_etag(request.get_full_path(), updated.isoformat()), updated
+
+@cache_response
+@conditional_response(list_validator(Album, Tombstone.ALBUM))
 def handle_album(request):
     if request.method == "GET":
         try:
-            all_albums = handle_album_search(request)
-            page_obj, size = handle_page(request, all_albums)
-            response = {"page": {
-                                "number": page_obj.number, 
-                                "hasNext": page_obj.has_next(),
-                                "hasPrev": page_obj.has_previous(),
-                                "startIndex": page_obj.start_index(),
-                                "endIndex": page_obj.end_index(),
-                                "size": size
-                                }, 
-                        "albums": []
-                    }
-            for album in page_obj.object_list:
-                response["albums"].append({
-                    "id": album.id,
-                    "title": album.title,
-                    "description": album.description,
-                    "imageURL": album.imageURL,
-                    "created": album.created
-                })
+            all_albums, serialize = handle_album_fields(request, handle_album_search(request))
+            albums, page = handle_page(request, all_albums)
+            response = {"page": page, "albums": []}
+            for album in albums:
+                response["albums"].append(serialize(album))
             return JsonResponse(response, status=200)
         except ObjectDoesNotExist:
             return JsonResponse({}, status=200)
+        except ValueError as e:
+            return JsonResponse({"message":str(e)}, status=400)
     elif request.method == "POST":
         if not check_staff(request):
             return JsonResponse({"message":NOT_AUTH}, status=401)
@@ -129,49 +328,111 @@ def handle_album(request):
         return JsonResponse({"message":"method not allowed"}, status=405)
 
 def handle_album_search(request):
+    # Every branch of the OR is served by an index (the primary key or the
+    # pg_trgm GIN indexes), so the planner can use a BitmapOr instead of a
+    # sequential scan.
     if 'search' in request.GET:
-        return Album.objects.all().filter(Q(id__contains=request.GET.get('search')) | 
-                                                Q(title__contains=request.GET.get('search')) | 
-                                                Q(description__contains=request.GET.get('search')) |
-                                                Q(imageURL__contains=request.GET.get('search')) |
-                                                Q(created__contains=request.GET.get('search')) |
-                                                Q(reference__contains=request.GET.get('search'))
-                                                ).order_by('-created')
-    return Album.objects.all().order_by('-created')
+        search = request.GET.get('search')
+        match = Q(id=search) | \
+            Q(title__contains=search) | \
+            Q(description__contains=search) | \
+            Q(reference__contains=search)
+        if request.GET.get('searchMode') == 'similarity':
+            similarity = Greatest(TrigramSimilarity('title', search),
+                                  TrigramSimilarity('description', search),
+                                  TrigramSimilarity('reference', search))
+            return album_queryset().annotate(similarity=similarity).filter(
+                match | Q(title__trigram_similar=search)
+            ).order_by('-similarity', '-created', '-id')
+        return album_queryset().filter(match).order_by('-created', '-id')
+    return album_queryset().order_by('-created', '-id')
+
+def album_validator(request, album_id):
+    updated = Album.objects.filter(id=album_id).values_list('updated', flat=True).first()
+    if updated is None or not include_posts_or_error(request):
+        return detail_etag(request, updated)
+    posts_updated = Post.objects.aggregate(updated=Max('updated'))["updated"]
+    deleted = Tombstone.objects.filter(kind=Tombstone.POST).aggregate(deleted=Max('deleted'))["deleted"]
+    return album_posts_etag(request, updated, posts_updated, deleted)
+
+def album_posts_etag(request, updated, posts_updated, deleted):
+    # Posts join, leave or disappear from an album without touching the album
+    # row, so embedded posts are validated against the whole post table.
+    timestamps = [timestamp for timestamp in (updated, posts_updated, deleted) if timestamp is not None]
+    return make_etag(request.get_full_path(), updated.isoformat(), posts_updated, deleted), max(timestamps)
+
+def include_posts(request):
+    if 'include' not in request.GET:
+        return False
+    if request.GET.get('include') != 'posts':
+        raise ValueError(INVALID_INCLUDE)
+    return True
 
+def include_posts_or_error(request):
+    # An invalid include is answered with 400 by get_album.
+    try:
+        return include_posts(request)
+    except ValueError:
+        return False
+
+@cache_response
+@conditional_response(album_validator)
 def handle_album_by_id(request, album_id):
     if request.method == "GET":
         return get_album(request, album_id)
 
-    elif request.method == "PUT" and check_staff(request):
+    if not check_staff(request):
+        return JsonResponse({"message":NOT_AUTH}, status=401)
+
+    if request.method == "PUT":
         return edit_album(request, album_id)
 
-    elif request.method == "POST" and check_staff(request):
+    elif request.method == "POST":
         return create_album(request, album_id)
     
-    elif request.method == "DELETE" and check_staff(request):
+    elif request.method == "DELETE":
         return delete_album(request, album_id)
 
     return JsonResponse({"message":NOT_AUTH}, status=401)
 
 def get_album(request, album_id):
     try:
-        album = Album.objects.get(id=album_id)
-        response = {
-            "id": album.id,
-            "title": album.title,
-            "description": album.description,
-            "imageURL": album.imageURL,
-            "created": album.created
-        }
+        album = album_queryset().get(id=album_id)
+        response = create_album_response(album)
+        if include_posts(request):
+            # The album, the post count and one page of its posts, whatever
+            # the size of the album.
+            posts, serialize = handle_post_fields(request, album_posts_queryset(album_id))
+            post_count = posts.count()
+            posts, page = handle_page(request, posts, post_count)
+            response["postCount"] = post_count
+            response["page"] = page
+            response["posts"] = [serialize(post) for post in posts]
         return JsonResponse(response, status=200)
     except ObjectDoesNotExist:
         return JsonResponse({}, status=200)
+    except ValueError as e:
+        return JsonResponse({"message":str(e)}, status=400)
+
+def album_posts_queryset(album_id):
+    return post_queryset().filter(album_id=album_id).order_by('-created', '-id')
+
+def album_queryset():
+    return Album.objects.only(*ALBUM_FIELDS)
+
+def create_album_response(album):
+    return {
+        "id": album.id,
+        "title": album.title,
+        "description": album.description,
+        "imageURL": album.imageURL,
+        "created": album.created
+    }
 
 def edit_album(request, album_id):
     try:
         body = json.loads(request.body)
-        album = Album.objects.get(id=album_id)
+        album = album_queryset().get(id=album_id)
         for key in body:
             if key == "title":
                 album.title = body[key]
@@ -181,14 +442,9 @@ def edit_album(request, album_id):
                 album.imageURL = body[key]
             else:
                 return JsonResponse({"message":ALBUM_UPDATE_DENY}, status=400)
-        album.save()
-        response = {
-            "id": album.id,
-            "title": album.title,
-            "description": album.description,
-            "imageURL": album.imageURL,
-            "created": album.created
-        }
+        # auto_now is only applied to fields listed in update_fields.
+        album.save(update_fields=list(body) + ['updated'])
+        response = create_album_response(album)
         return JsonResponse(response, status=200)
     except ObjectDoesNotExist:
         return JsonResponse({"message":ALBUM_UPDATE_DENY}, status=400)
@@ -198,18 +454,10 @@ def edit_album(request, album_id):
 def create_album(request, album_id):
     try:
         body = json.loads(request.body)
-        album = Album.objects.create(id=album_id, title=body["title"], \
-            description=body["description"])
-        if "imageURL" in body:
-            album.imageURL = body["imageURL"]
-            album.save()
-        response = {
-            "id": album.id,
-            "title": album.title,
-            "description": album.description,
-            "imageURL": album.imageURL,
-            "created": album.created
-        }
+        album = Album(id=album_id, title=body["title"], \
+            description=body["description"], imageURL=body.get("imageURL"))
+        album.save(force_insert=True)
+        response = create_album_response(album)
         return JsonResponse(response, status=201)
     except IntegrityError:
         return JsonResponse({"message":ALBUM_CREATE_DENY}, status=400)
@@ -227,39 +475,23 @@ def delete_album(request, album_id):
         return JsonResponse({"message":"could not delete album"}, status=400)
 
 
+@cache_response
+@conditional_response(list_validator(Post, Tombstone.POST))
 def handle_post(request):
     if request.method == "GET":
+        if 'ids' in request.GET:
+            return get_posts_by_ids(request)
         try:
-            all_posts = handle_post_search(request)
-            page_obj, size = handle_page(request, all_posts)
-            response = {"page": {
-                                "number": page_obj.number, 
-                                "hasNext": page_obj.has_next(),
-                                "hasPrev": page_obj.has_previous(),
-                                "startIndex": page_obj.start_index(),
-                                "endIndex": page_obj.end_index(),
-                                "size": size
-                                }, 
-                        "posts": []
-                    }
-            for post in page_obj.object_list:
-                post_dict = {
-                    "id": post.id,
-                    "user": str(post.user),
-                    "title": post.title,
-                    "content": post.content,
-                    "created": post.created,
-                    "imageURLs": post.imageURLs,
-                    "videoURLs": post.videoURLs,
-                }
-                try:
-                    post_dict["album"] = post.album.id
-                except AttributeError:
-                    post_dict["album"] = None
-                response["posts"].append(post_dict)
+            all_posts, serialize = handle_post_fields(request, handle_post_search(request))
+            posts, page = handle_page(request, all_posts)
+            response = {"page": page, "posts": []}
+            for post in posts:
+                response["posts"].append(serialize(post))
             return JsonResponse(response, status=200)
         except ObjectDoesNotExist:
             return JsonResponse({}, status=200)
+        except ValueError as e:
+            return JsonResponse({"message":str(e)}, status=400)
             
     elif request.method == "POST":
         if not check_staff(request):
@@ -268,59 +500,82 @@ def handle_post(request):
     else:
         return JsonResponse({"message":"method not allowed"}, status=405)
 
+def parse_ids(value):
+    ids = list(dict.fromkeys(object_id.strip() for object_id in value.split(',') if object_id.strip()))
+    if len(ids) > MAX_IDS:
+        raise ValueError(TOO_MANY_IDS)
+    return ids
+
+def get_posts_by_ids(request):
+    try:
+        ids = parse_ids(request.GET.get('ids'))
+        objects, serialize = handle_post_fields(request, post_queryset())
+    except ValueError as e:
+        return JsonResponse({"message":str(e)}, status=400)
+    posts = objects.in_bulk(ids)
+    return JsonResponse(create_posts_by_ids_response(ids, posts, serialize), status=200)
+
+def create_posts_by_ids_response(ids, posts, serialize):
+    # Posts come back in the order they were asked for, unknown ids are left out.
+    return {"posts": [serialize(posts[post_id]) for post_id in ids if post_id in posts]}
+
 def handle_post_search(request):
-    if 'search' in request.GET:
-        return Post.objects.all().filter(Q(id__contains=request.GET.get('search')) | 
-                                            Q(title__contains=request.GET.get('search')) | 
-                                            Q(user__username__contains=request.GET.get('search')) |
-                                            Q(content__contains=request.GET.get('search')) |
-                                            Q(imageURLs__contains=[request.GET.get('search')]) | 
-                                            Q(videoURLs__contains=[request.GET.get('search')]) |
-                                            Q(album__title__contains=request.GET.get('search')) | 
-                                            Q(album__id__contains=request.GET.get('search')) | 
-                                            Q(created__contains=request.GET.get('search'))
-                                            ).order_by('-created')
-    return Post.objects.all().order_by('-created')
+    if 'search' in request.GET and request.GET.get('search').strip():
+        if request.GET.get('searchMode') == 'substring':
+            return handle_post_substring_search(request)
+        search = request.GET.get('search')
+        query = SearchQuery(search, config=SEARCH_CONFIG, search_type='websearch')
+        return post_queryset().annotate(rank=SearchRank(F('search_vector'), query)).filter(
+                                            Q(search_vector=query) |
+                                            Q(id=search) |
+                                            Q(album_id=search)
+                                            ).order_by('-rank', '-created', '-id')
+    return post_queryset().order_by('-created', '-id')
+
+def handle_post_substring_search(request):
+    return post_queryset().filter(Q(id__contains=request.GET.get('search')) | 
+                                        Q(title__contains=request.GET.get('search')) | 
+                                        Q(user__username__contains=request.GET.get('search')) |
+                                        Q(content__contains=request.GET.get('search')) |
+                                        Q(imageURLs__contains=[request.GET.get('search')]) | 
+                                        Q(videoURLs__contains=[request.GET.get('search')]) |
+                                        Q(album__title__contains=request.GET.get('search')) | 
+                                        Q(album__id__contains=request.GET.get('search')) | 
+                                        Q(created__contains=request.GET.get('search'))
+                                        ).order_by('-created', '-id')
 
+@cache_response
+@conditional_response(detail_validator(Post, 'post_id'))
 def handle_post_by_id(request, post_id):
     if request.method == "GET":
         return get_post(request, post_id)
 
-    elif request.method == "PUT" and check_staff(request):
+    if not check_staff(request):
+        return JsonResponse({"message":NOT_AUTH}, status=401)
+
+    if request.method == "PUT":
         return edit_post(request, post_id)
 
-    elif request.method == "POST" and check_staff(request):
+    elif request.method == "POST":
         return create_post(request, post_id)
-
-    elif request.method == "DELETE" and check_staff(request):
+    
+    elif request.method == "DELETE":
         return delete_post(request, post_id)
 
     return JsonResponse({"message":NOT_AUTH}, status=401)
 
 def get_post(request, post_id):
     try:
-        post = Post.objects.get(id=post_id)
-        response = {
-            "id": post.id,
-            "user": str(post.user),
-            "title": post.title,
-            "content": post.content,
-            "created": post.created,
-            "imageURLs": post.imageURLs,
-            "videoURLs": post.videoURLs,
-        }
-        try:
-            response["album"] = post.album.id
-        except AttributeError:
-            response["album"] = None
-        return JsonResponse(response)
+        post = post_queryset().get(id=post_id)
+        return JsonResponse(create_post_response(post))
     except ObjectDoesNotExist:
         return JsonResponse({}, status=200)
 
 def edit_post(request, post_id):
     try:
         body = json.loads(request.body)
-        post = Post.objects.get(id=post_id)
+        post = post_queryset().get(id=post_id)
+        update_fields = ['updated']
         for key in body:
             if key == "title":
                 post.title = body[key]
@@ -331,14 +586,14 @@ def edit_post(request, post_id):
             elif key == "videoURLs" and type(body[key]) == list:
                 post.videoURLs = body[key]
             elif key == "album":
-                try:
-                    album = Album.objects.get(id=body[key])
-                    post.album = album
-                except ObjectDoesNotExist:
-                    None
+                if not album_exists(body[key]):
+                    continue
+                post.album_id = body[key]
             else:
                 return JsonResponse({"message":POST_UPDATE_DENY}, status=400)
-        post.save()
+            update_fields.append(key)
+        # auto_now is only applied to fields listed in update_fields.
+        post.save(update_fields=update_fields)
         response = create_post_response(post)
         return JsonResponse(response, status=200)
     except ObjectDoesNotExist:
@@ -346,8 +601,14 @@ def edit_post(request, post_id):
     except json.JSONDecodeError:
         return JsonResponse({"message":POST_UPDATE_DENY}, status=400)
 
+def album_exists(album_id):
+    return isinstance(album_id, str) and Album.objects.filter(id=album_id).exists()
+
+def post_queryset():
+    return Post.objects.select_related('user').only(*POST_FIELDS)
+
 def create_post_response(post):
-    response = {
+    return {
         "id": post.id,
         "user": str(post.user),
         "title": post.title,
@@ -355,35 +616,23 @@ def create_post_response(post):
         "created": post.created,
         "imageURLs": post.imageURLs,
         "videoURLs": post.videoURLs,
-        "album": None
+        "album": post.album_id
     }
-    if post.album != None:
-        response["album"] = post.album.id
-    return response
 
 def create_post(request, post_id):
     try:
         body = json.loads(request.body)
-        current_user = request.user
-        user = User.objects.get(username=current_user) 
-        post = Post.objects.create(id=post_id, title=body["title"], \
-            content=body["content"], user=user)
+        post = Post(id=post_id, title=body["title"], \
+            content=body["content"], user=request.user)
         
         if "imageURLs" in body and type(body["imageURLs"]) == list:
             post.imageURLs = body["imageURLs"]
-            post.save()
         if "videoURLs" in body and type(body["videoURLs"]) == list:
             post.videoURLs = body["videoURLs"]
-            post.save()
-        
-        if "album" in body:
-            try:
-                album = Album.objects.get(id=body["album"])
-                post.album = album
-                post.save()
-            except ObjectDoesNotExist:
-                None
+        if "album" in body and album_exists(body["album"]):
+            post.album_id = body["album"]
 
+        post.save(force_insert=True)
         response = create_post_response(post)
         return JsonResponse(response, status=201)
     except IntegrityError:
@@ -393,10 +642,180 @@ def create_post(request, post_id):
     except KeyError:
         return JsonResponse({"message":POST_CREATE_DENY}, status=400)
 
+def handle_post_bulk(request):
+    if request.method != "POST":
+        return JsonResponse({"message":"method not allowed"}, status=405)
+    if not check_staff(request):
+        return JsonResponse({"message":NOT_AUTH}, status=401)
+    try:
+        body = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({"message":POST_CREATE_DENY}, status=400)
+    if type(body) != list or not 0 < len(body) <= MAX_BULK_SIZE:
+        return JsonResponse({"message":POST_CREATE_DENY}, status=400)
+    for index, item in enumerate(body):
+        if not valid_bulk_post(item):
+            return JsonResponse({"message":POST_CREATE_DENY, "index":index}, status=400)
+
+    # Unknown albums are dropped like in create_post, but all of them are
+    # looked up with one query instead of one per post.
+    album_ids = {item["album"] for item in body if item.get("album")}
+    albums = set(Album.objects.filter(id__in=album_ids).values_list('id', flat=True)) if album_ids else set()
+    posts = [Post(id=item.get("id") or str(uuid.uuid4()),
+                  title=item["title"],
+                  content=item["content"],
+                  imageURLs=item.get("imageURLs", []),
+                  videoURLs=item.get("videoURLs", []),
+                  album_id=item.get("album") if item.get("album") in albums else None,
+                  user=request.user)
+             for item in body]
+    try:
+        with transaction.atomic():
+            Post.objects.bulk_create(posts)
+    except (IntegrityError, DataError):
+        return JsonResponse({"message":POST_CREATE_DENY}, status=400)
+    # bulk_create sends no post_save signals.
+    bump_generation()
+    return JsonResponse({"posts": [create_post_response(post) for post in posts]}, status=201)
+
+def valid_bulk_post(item):
+    if type(item) != dict:
+        return False
+    if type(item.get("title")) != str or type(item.get("content")) != str:
+        return False
+    for key in ("imageURLs", "videoURLs"):
+        if key in item and (type(item[key]) != list or not all(type(url) == str for url in item[key])):
+            return False
+    for key in ("id", "album"):
+        if item.get(key) is not None and type(item[key]) != str:
+            return False
+    return True
+
 def delete_post(request, post_id):
     try:
         post = Post.objects.get(id=post_id)
         post.delete()
         return JsonResponse({"message":"post deleted"}, status=200)
     except ObjectDoesNotExist:
-        return JsonResponse({"message":"could not delete post"}, status=400)
\ No newline at end of file
+        return JsonResponse({"message":"could not delete post"}, status=400)
+
+def handle_sync(request):
+    if request.method != "GET":
+        return JsonResponse({"message":"method not allowed"}, status=405)
+    size = SYNC_SIZE
+    try:
+        if 'size' in request.GET:
+            size = min(max(int(request.GET.get('size')), 1), MAX_SYNC_SIZE)
+    except ValueError:
+        pass
+    try:
+        if request.GET.get('cursor'):
+            until, positions = decode_sync_cursor(request.GET.get('cursor'))
+        else:
+            since = parse_datetime(request.GET.get('since', ''))
+            if since is None:
+                raise ValueError(INVALID_SINCE)
+            # Rows are stamped before they commit, so the window stops
+            # API_SYNC_LAG seconds back to leave slow transactions and clock
+            # skew between app servers time to land before it closes.
+            until = timezone.now() - datetime.timedelta(seconds=settings.API_SYNC_LAG)
+            positions = {stream: [since.isoformat(), None] for stream in ("posts", "albums", "deleted")}
+    except ValueError as e:
+        return JsonResponse({"message":str(e)}, status=400)
+
+    # Each stream is read in (timestamp, id) order inside the (since, until]
+    # window that was fixed by the first request, so a client can follow
+    # nextCursor through any number of changes without missing or repeating
+    # rows, and then store "until" as the next "since".
+    has_more = False
+    streams = (
+        ("posts", post_queryset(), 'updated', create_sync_response(create_post_response)),
+        ("albums", album_queryset(), 'updated', create_sync_response(create_album_response)),
+        ("deleted", Tombstone.objects.all(), 'deleted', create_tombstone_response),
+    )
+    response = {}
+    for stream, objects, timestamp_field, serialize in streams:
+        timestamp, object_id = positions[stream]
+        after = Q(**{timestamp_field + '__gt': timestamp})
+        if object_id is not None:
+            after |= Q(**{timestamp_field: timestamp, 'id__gt': object_id})
+        rows = list(objects.filter(after, **{timestamp_field + '__lte': until})
+                    .order_by(timestamp_field, 'id')[:size + 1])
+        if len(rows) > size:
+            has_more = True
+            rows = rows[:size]
+        if rows:
+            positions[stream] = [getattr(rows[-1], timestamp_field).isoformat(), rows[-1].id]
+        response[stream] = [serialize(row) for row in rows]
+    response["hasMore"] = has_more
+    response["nextCursor"] = encode_sync_cursor(until, positions) if has_more else None
+    response["until"] = until
+    return JsonResponse(response, status=200)
+
+def create_sync_response(create_response):
+    def serialize(obj):
+        response = create_response(obj)
+        response["updated"] = obj.updated
+        return response
+    return serialize
+
+def create_tombstone_response(tombstone):
+    return {
+        "type": tombstone.kind,
+        "id": tombstone.object_id,
+        "deleted": tombstone.deleted
+    }
+
+def encode_sync_cursor(until, positions):
+    value = json.dumps({"until": until.isoformat(), "positions": positions})
+    return urlsafe_base64_encode(value.encode())
+
+def decode_sync_cursor(cursor):
+    try:
+        value = json.loads(urlsafe_base64_decode(cursor))
+        until = parse_datetime(value["until"])
+        positions = {stream: list(value["positions"][stream]) for stream in ("posts", "albums", "deleted")}
+        for timestamp, object_id in positions.values():
+            if parse_datetime(timestamp) is None:
+                raise ValueError(INVALID_CURSOR)
+    except (ValueError, TypeError, KeyError):
+        raise ValueError(INVALID_CURSOR)
+    if until is None:
+        raise ValueError(INVALID_CURSOR)
+    return until, positions
+
+def handle_export(request):
+    if request.method != "GET":
+        return JsonResponse({"message":"method not allowed"}, status=405)
+    if not check_staff(request):
+        return JsonResponse({"message":NOT_AUTH}, status=401)
+    return create_export_response(export_chunks())
+
+def create_export_response(chunks):
+    response = StreamingHttpResponse(chunks, content_type="application/x-ndjson")
+    response['Content-Disposition'] = 'attachment; filename="%s"' % EXPORT_FILENAME
+    return response
+
+def handle_metrics(request):
+    if request.method != "GET":
+        return JsonResponse({"message":"method not allowed"}, status=405)
+    if not check_staff(request):
+        return JsonResponse({"message":NOT_AUTH}, status=401)
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+def handle_profiles(request):
+    if request.method != "GET":
+        return JsonResponse({"message":"method not allowed"}, status=405)
+    if not check_staff(request):
+        return JsonResponse({"message":NOT_AUTH}, status=401)
+    return JsonResponse({"profiles":list_profiles()}, status=200)
+
+def handle_profile(request, name):
+    if request.method != "GET":
+        return JsonResponse({"message":"method not allowed"}, status=405)
+    if not check_staff(request):
+        return JsonResponse({"message":NOT_AUTH}, status=401)
+    path = profile_path(name)
+    if path is None:
+        return JsonResponse({"message":PROFILE_NOT_FOUND}, status=404)
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=name)
@@ -0,0 +1,63 @@
+"""
+Show the query plans of the old and the trigram-indexed album search.
+
+    python -m benchmarks.album_search --rows 100000 --search "word"
+
+The old search ORs six LIKE '%x%' predicates, including a cast of `created`
+to text, which forces a sequential scan. The new search only uses predicates
+that the primary key and the pg_trgm GIN indexes can answer, so the plan
+becomes a BitmapOr of bitmap index scans.
+"""
+
+import argparse
+
+from benchmarks.utils import setup_django, test_database, seed_albums, timed, summarize
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--search', help="defaults to a word from a seeded album title")
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection
+    from api.models import Album
+
+    with test_database():
+        seed_albums(args.rows)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE api_album")
+        search = args.search or Album.objects.order_by('id')[args.rows // 2].title.split()[0]
+        print("searching for %r in %d albums\n" % (search, args.rows))
+        run(search, args.repeat)
+
+
+def run(search, repeat):
+    from django.db.models import Q
+    from django.test import RequestFactory
+    from api.models import Album
+    from api.views import handle_album_search
+
+    old = Album.objects.filter(Q(id__contains=search) |
+                               Q(title__contains=search) |
+                               Q(description__contains=search) |
+                               Q(imageURL__contains=search) |
+                               Q(created__contains=search) |
+                               Q(reference__contains=search)).order_by('-created')
+    searches = (
+        ("old substring search", old),
+        ("trigram search", handle_album_search(RequestFactory().get('/api/album/', {'search': search}))),
+        ("trigram similarity search", handle_album_search(
+            RequestFactory().get('/api/album/', {'search': search, 'searchMode': 'similarity'}))),
+    )
+    for label, queryset in searches:
+        samples = timed(lambda: list(queryset[:10]), repeat)
+        print("== %s: p50 %.2f ms" % (label, summarize(samples)["p50"]))
+        print(queryset.explain(analyze=True))
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Compare the cost of authenticating a staff write in every session mode
+and with a bearer token.
+
+    python -m benchmarks.auth --repeat 200
+
+Each mode logs in once and then edits the same post --repeat times through
+the full middleware stack. The queries that touch django_session or
+auth_user are counted, next to the median and p95 latency in milliseconds.
+"""
+
+import argparse
+import json
+import uuid
+
+from benchmarks.utils import setup_django, test_database, timed, summarize
+
+PASSWORD = "benchmark"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from django.test import Client, override_settings
+    from django.test.utils import CaptureQueriesContext
+    from api.models import Post
+
+    body = json.dumps({"title": "benchmark", "content": "benchmark"})
+    modes = [(name, {'SESSION_ENGINE': engine}, False) for name, engine in settings.SESSION_ENGINES.items()]
+    modes.append(("token", {}, True))
+
+    print("%-16s %14s %10s %10s" % ("mode", "auth queries", "p50 ms", "p95 ms"))
+    with test_database():
+        admin = User.objects.create_superuser('benchmark', password=PASSWORD)
+        post = Post.objects.create(id=str(uuid.uuid4()), title="benchmark", content="benchmark")
+        url = '/api/post/%s/' % post.id
+        for name, overrides, token in modes:
+            with override_settings(**overrides):
+                client = Client()
+                headers = {}
+                if token:
+                    response = client.post('/api/login/', {"username": admin.username, "password": PASSWORD,
+                                                           "token": True}, content_type='application/json')
+                    headers['Authorization'] = 'Bearer ' + response.json()["token"]
+                else:
+                    client.login(username=admin.username, password=PASSWORD)
+
+                def edit():
+                    response = client.put(url, body, content_type='application/json', headers=headers)
+                    assert response.status_code == 200, response.content
+
+                # The first request fills the cached_db and cache session backends.
+                edit()
+                with CaptureQueriesContext(connection) as queries:
+                    edit()
+                auth_queries = len([query for query in queries
+                                    if 'django_session' in query['sql'] or 'FROM "auth_user"' in query['sql']])
+                result = summarize(timed(edit, args.repeat))
+                print("%-16s %14d %10.2f %10.2f" % (name, auth_queries, result["p50"], result["p95"]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Measure cold start: the time from starting the server until the feed
+answers 200.
+
+    python -m benchmarks.coldstart --image thetogetherblog:before --image thetogetherblog:after \\
+        --docker-arg=--env-file=.env
+    python -m benchmarks.coldstart --command ./start.sh \\
+        --command "sh -c 'python manage.py makemigrations api && python manage.py migrate && ./start.sh'"
+
+Images are started with docker run, commands are run locally with the
+current environment. Each target is started --runs times.
+"""
+
+import argparse
+import shlex
+import subprocess
+import time
+import urllib.error
+import urllib.request
+
+from benchmarks.utils import summarize
+
+
+def wait_for(url, timeout):
+    start = time.perf_counter()
+    deadline = start + timeout
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=5) as response:
+                if response.status == 200:
+                    return time.perf_counter() - start
+        except (OSError, urllib.error.URLError):
+            pass
+        time.sleep(0.05)
+    raise RuntimeError("%s did not answer within %d seconds" % (url, timeout))
+
+
+def cold_start(command, url, timeout):
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for(url, timeout)
+        return time.perf_counter() - start
+    finally:
+        process.terminate()
+        try:
+            process.wait(30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--image', action='append', default=[], help="docker image to start")
+    parser.add_argument('--docker-arg', action='append', default=[], help="extra docker run argument")
+    parser.add_argument('--command', action='append', default=[], help="local start command")
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--path', default='/api/post/')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--timeout', type=float, default=300)
+    args = parser.parse_args()
+    if not args.image and not args.command:
+        parser.error("pass --image or --command")
+
+    url = 'http://127.0.0.1:%d%s' % (args.port, args.path)
+    targets = [(image, ['docker', 'run', '--rm', '-p', '%d:8000' % args.port] + args.docker_arg + [image])
+               for image in args.image]
+    targets += [(command, shlex.split(command)) for command in args.command]
+    for label, command in targets:
+        samples = [cold_start(command, url, args.timeout) * 1000 for _ in range(args.runs)]
+        result = summarize(samples)
+        print("%s\n    p50 %.0f ms, p95 %.0f ms, max %.0f ms over %d runs" % (
+            label, result["p50"], result["p95"], max(samples), args.runs))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+Measure the per-request cost of opening a database connection.
+
+    python -m benchmarks.connections --requests 500
+
+Runs the feed view through the same request_started/request_finished
+connection handling as a real server, once with CONN_MAX_AGE=0 (a new
+connection for every request, the old default) and once with persistent
+connections, and prints the mean time per request of both.
+"""
+
+import argparse
+
+from benchmarks.utils import setup_django, test_database, seed_posts, timed, summarize
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--rows', type=int, default=100)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.signals import request_finished, request_started
+    from django.db import connection
+    from django.test import RequestFactory, override_settings
+    from api.views import handle_post
+
+    factory = RequestFactory()
+
+    def request():
+        request_started.send(sender=None)
+        try:
+            handle_post(factory.get('/api/post/'))
+        finally:
+            request_finished.send(sender=None)
+
+    no_cache = {'api': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+    with test_database(), override_settings(CACHES=no_cache):
+        seed_posts(args.rows)
+        results = {}
+        for label, max_age in (("new connection per request", 0), ("persistent connection", 600)):
+            connection.close()
+            connection.settings_dict['CONN_MAX_AGE'] = max_age
+            samples = timed(request, args.requests)
+            results[label] = sum(samples) / len(samples)
+            print("%-28s mean %.3f ms, p99 %.3f ms" % (label, results[label], summarize(samples)["p99"]))
+        print("connect overhead removed: %.3f ms per request" % (
+            results["new connection per request"] - results["persistent connection"]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Time serializing one page of posts with each JSON encoder.
+
+    python -m benchmarks.encoder --posts 100 --repeat 2000
+
+The page is built with create_post_response from unsaved posts with three
+image and two video URLs each, so no database is needed. Django's
+JsonResponse (DjangoJSONEncoder) is the baseline for the encoders in
+api/responses.py.
+"""
+
+import argparse
+import uuid
+
+from benchmarks.utils import setup_django, words, timed, summarize
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--posts', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.http import JsonResponse as DjangoJsonResponse
+    from django.utils import timezone
+    from api import responses
+    from api.models import Post
+    from api.views import create_post_response
+
+    page = {
+        "page": {"number": 1, "hasNext": True, "hasPrev": False, "startIndex": 1,
+                 "endIndex": args.posts, "size": args.posts},
+        "posts": [create_post_response(Post(id=str(uuid.uuid4()),
+                                            title=words(4),
+                                            content=words(60),
+                                            created=timezone.now(),
+                                            imageURLs=["https://example.com/images/%s.jpg" % uuid.uuid4()
+                                                       for _ in range(3)],
+                                            videoURLs=["https://www.youtube.com/watch?v=%s" % uuid.uuid4().hex[:11]
+                                                       for _ in range(2)],
+                                            album_id=str(uuid.uuid4())))
+                  for _ in range(args.posts)],
+    }
+    encoders = [("DjangoJSONEncoder", lambda: DjangoJsonResponse(page).content)]
+    for name in sorted(responses.ENCODERS):
+        if name == 'orjson' and responses.orjson is None:
+            print("orjson is not installed, skipping it")
+            continue
+        encoders.append((name, lambda encoder=responses.ENCODERS[name]: encoder(page)))
+
+    print("%d posts, %d bytes\n" % (args.posts, len(responses.encode_json(page))))
+    print("%-18s %10s %10s %10s" % ("encoder", "p50 ms", "p95 ms", "p99 ms"))
+    for name, encode in encoders:
+        timed(encode, args.repeat // 10)
+        result = summarize(timed(encode, args.repeat))
+        print("%-18s %10.3f %10.3f %10.3f" % (name, result["p50"], result["p95"], result["p99"]))
+
+
+if __name__ == '__main__':
+    main()
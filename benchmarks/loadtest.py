@@ -0,0 +1,131 @@
+"""
+Load test the post feed and report requests per second and latency.
+
+    python -m benchmarks.loadtest --url http://localhost:8000/api/post/
+    python -m benchmarks.loadtest --server runserver --server gunicorn
+    python -m benchmarks.loadtest --server gunicorn --server asgi --concurrency 16 --concurrency 128
+
+With --server the script starts each entry point itself on --port, using
+the current environment (settings module, database, GUNICORN_* variables),
+runs the same load against it and stops it again. The server reads the
+configured database, so point it at development data, not production.
+"gunicorn" is the WSGI deployment with the sync views, "asgi" the same
+gunicorn config with uvicorn workers serving the async views. Every
+--concurrency level is run against every server.
+"""
+
+import argparse
+import http.client
+import os
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+from benchmarks.utils import summarize
+
+SERVERS = {
+    'runserver': lambda port: [sys.executable, 'manage.py', 'runserver', '--noreload', '127.0.0.1:%d' % port],
+    'gunicorn': lambda port: [sys.executable, '-m', 'gunicorn', 'thetogetherblog.wsgi:application',
+                              '--config', 'gunicorn.conf.py', '--bind', '127.0.0.1:%d' % port],
+    'asgi': lambda port: [sys.executable, '-m', 'gunicorn', 'thetogetherblog.asgi:application',
+                          '--config', 'gunicorn.conf.py', '--bind', '127.0.0.1:%d' % port,
+                          '--worker-class', 'uvicorn_worker.UvicornWorker'],
+}
+
+
+def client(url, deadline, latencies, errors):
+    parts = urlsplit(url)
+    path = parts.path + ('?' + parts.query if parts.query else '')
+    connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            connection.request('GET', path)
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+            else:
+                latencies.append((time.perf_counter() - start) * 1000)
+            if response.will_close:
+                connection.close()
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(e)
+            connection.close()
+    connection.close()
+
+
+def run(url, concurrency, duration):
+    latencies = []
+    errors = []
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=client, args=(url, deadline, latencies, errors))
+               for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result = {"requests": len(latencies), "errors": len(errors), "rps": len(latencies) / duration}
+    if latencies:
+        result.update(summarize(latencies))
+    return result
+
+
+def wait_for(url, timeout=60):
+    deadline = time.time() + timeout
+    parts = urlsplit(url)
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=5)
+            connection.request('GET', parts.path)
+            connection.getresponse().read()
+            connection.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("server did not answer %s within %d seconds" % (url, timeout))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help="feed URL of an already running server")
+    parser.add_argument('--server', action='append', choices=sorted(SERVERS), help="entry point to start and test")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--path', default='/api/post/?size=10')
+    parser.add_argument('--concurrency', type=int, action='append', help="concurrent connections (default 16)")
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--warmup', type=float, default=2)
+    args = parser.parse_args()
+    if not args.url and not args.server:
+        parser.error("pass --url or --server")
+    concurrency = args.concurrency or [16]
+
+    targets = [(args.url, None)] if args.url else [
+        ('http://127.0.0.1:%d%s' % (args.port, args.path), server) for server in args.server]
+    print("%-10s %11s %10s %8s %10s %10s %10s" % ("server", "concurrency", "requests", "errors", "req/s",
+                                                "p50 ms", "p99 ms"))
+    for url, server in targets:
+        process = None
+        if server:
+            # Recycling a worker mid-run drops its keep-alive connections.
+            env = dict(os.environ, GUNICORN_ACCESS_LOG='')
+            env.setdefault('GUNICORN_MAX_REQUESTS', '0')
+            process = subprocess.Popen(SERVERS[server](args.port), env=env,
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for(url)
+            for connections in concurrency:
+                run(url, connections, args.warmup)
+                result = run(url, connections, args.duration)
+                print("%-10s %11d %10d %8d %10.1f %10.2f %10.2f" % (
+                    server or url, connections, result["requests"], result["errors"],
+                    result["rps"], result.get("p50", 0), result.get("p99", 0)))
+        finally:
+            if process:
+                process.terminate()
+                process.wait()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""
+Compare offset (Paginator) and cursor pagination on GET /api/post/.
+
+    python -m benchmarks.pagination --rows 10000 100000 1000000
+
+For every table size the first, middle and last page is requested in both
+modes and the median latency is printed in milliseconds. The response cache
+is off, so every request reaches the database.
+"""
+
+import argparse
+
+from benchmarks.utils import setup_django, test_database, seed_posts, timed, summarize
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--size', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.test import RequestFactory, override_settings
+    from api.models import Post
+    from api.views import encode_cursor, handle_post
+
+    factory = RequestFactory()
+    print("%10s %8s %12s %12s" % ("rows", "depth", "offset ms", "cursor ms"))
+    no_cache = {'api': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+    with test_database(), override_settings(CACHES=no_cache):
+        for rows in sorted(args.rows):
+            seed_posts(rows)
+            pages = rows // args.size
+            for label, page in (("first", 1), ("middle", pages // 2), ("last", pages)):
+                offset_query = {'page': page, 'size': args.size}
+                cursor_query = {'cursor': '', 'size': args.size}
+                if page > 1:
+                    previous = Post.objects.order_by('-created', '-id')[(page - 1) * args.size - 1]
+                    cursor_query['cursor'] = encode_cursor(previous, "next")
+                offset = timed(lambda: handle_post(factory.get('/api/post/', offset_query)), args.repeat)
+                cursor = timed(lambda: handle_post(factory.get('/api/post/', cursor_query)), args.repeat)
+                print("%10d %8s %12.2f %12.2f" % (rows, label, summarize(offset)["p50"], summarize(cursor)["p50"]))
+
+
+if __name__ == '__main__':
+    main()
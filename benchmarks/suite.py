@@ -0,0 +1,143 @@
+"""
+Benchmark suite for the API's hot paths, run by manage.py bench.
+
+Every scenario is one request through the Django test client, so the whole
+middleware stack and the view are timed, but no server or network. The
+response cache is disabled unless asked for, so repeated GETs measure the
+database. Seeded data comes from the fixed random seed in benchmarks.utils,
+so runs with the same --posts and --albums see the same rows.
+
+Results hold p50/p95/p99 in milliseconds and the queries per request of
+every scenario. compare() checks them against an earlier run.
+"""
+
+import platform
+import subprocess
+import time
+
+import django
+
+from benchmarks.utils import seed_posts, summarize
+
+NO_CACHE = {'api': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+PAGE_SIZE = 10
+PASSWORD = "benchmark"
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def seed(posts, albums):
+    from django.contrib.auth.models import User
+    seed_posts(posts, albums)
+    return User.objects.create_superuser('benchmark', password=PASSWORD)
+
+
+def scenarios(staff, repeat):
+    from api.models import Album, Post
+    from api.views import encode_cursor
+
+    feed = Post.objects.order_by('-created', '-id')
+    pages = max(feed.count() // PAGE_SIZE, 1)
+    post = feed.first()
+    album = Album.objects.order_by('-created', '-id').first()
+    middle = feed[(pages // 2) * PAGE_SIZE - 1] if pages > 1 else post
+    term = post.content.split()[0]
+    body = {"title": "benchmark", "content": "benchmark"}
+
+    yield "feed first page", None, lambda c: c.get('/api/post/', {'page': 1, 'size': PAGE_SIZE})
+    yield "feed middle page", None, lambda c: c.get('/api/post/', {'page': pages // 2, 'size': PAGE_SIZE})
+    yield "feed last page", None, lambda c: c.get('/api/post/', {'page': pages, 'size': PAGE_SIZE})
+    yield "feed middle cursor", None, lambda c: c.get('/api/post/', {'cursor': encode_cursor(middle, "next"),
+                                                                      'size': PAGE_SIZE})
+    yield "feed middle prev cursor", None, lambda c: c.get('/api/post/', {'cursor': encode_cursor(middle, "prev"),
+                                                                           'size': PAGE_SIZE})
+    yield "post search", None, lambda c: c.get('/api/post/', {'search': term, 'size': PAGE_SIZE})
+    yield "album search", None, lambda c: c.get('/api/album/', {'search': album.title.split()[0],
+                                                                'size': PAGE_SIZE})
+    yield "post detail", None, lambda c: c.get('/api/post/%s/' % post.id)
+    yield "album detail", None, lambda c: c.get('/api/album/%s/' % album.id)
+    yield "album with posts", None, lambda c: c.get('/api/album/%s/' % album.id, {'include': 'posts'})
+    yield "post create", staff, lambda c: c.post('/api/post/', body, content_type='application/json')
+    yield "post edit", staff, lambda c: c.put('/api/post/%s/' % post.id, body, content_type='application/json')
+    # Every delete needs a post of its own. The reads above ran before they
+    # were added, and before the creates.
+    doomed = iter(Post.objects.bulk_create([Post(id="benchmark-%d" % i, title="doomed", content="doomed")
+                                            for i in range(repeat)]))
+    yield "post delete", staff, lambda c: c.delete('/api/post/%s/' % next(doomed).id)
+
+
+def run_scenario(client, request, repeat, warmup):
+    from django.db import connection
+    for _ in range(warmup):
+        check(request(client))
+    samples = []
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            response = request(client)
+            samples.append((time.perf_counter() - start) * 1000)
+            check(response)
+    result = summarize(samples)
+    result["queries"] = counter.count / repeat
+    return result
+
+
+def check(response):
+    if response.status_code >= 400:
+        raise RuntimeError("%s %s" % (response.status_code, response.content[:200]))
+
+
+def run(staff, repeat, warmup, cache=False):
+    from django.test import Client, override_settings
+
+    results = {}
+    with override_settings(**({} if cache else {'CACHES': NO_CACHE})):
+        # The deletes also consume the warmup requests.
+        for name, user, request in scenarios(staff, repeat + warmup):
+            client = Client()
+            if user is not None:
+                client.force_login(user)
+            results[name] = run_scenario(client, request, repeat, warmup)
+    return results
+
+
+def environment():
+    from django.db import connection
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "postgres": connection.pg_version,
+        "machine": platform.machine(),
+    }
+
+
+def compare(baseline, results, threshold):
+    """
+    Return a row per scenario of both runs and the scenarios whose p50 grew
+    by more than threshold percent or that run more queries than before.
+    """
+    rows = []
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        change = (result["p50"] - before["p50"]) / before["p50"] * 100 if before["p50"] else 0
+        rows.append((name, before["p50"], result["p50"], change, before["queries"], result["queries"]))
+        if change > threshold or result["queries"] > before["queries"]:
+            regressions.append(name)
+    return rows, regressions
@@ -0,0 +1,90 @@
+"""
+Shared helpers for the benchmark scripts.
+
+Every benchmark runs against a throwaway test database created from the
+configured DATABASES settings, so it never touches real data.
+"""
+
+from contextlib import contextmanager
+import os
+import random
+import statistics
+import string
+import time
+import uuid
+
+import django
+
+BATCH_SIZE = 5000
+
+_random = random.Random(2021)
+WORDS = [''.join(_random.choice(string.ascii_lowercase) for _ in range(_random.randint(3, 10)))
+         for _ in range(5000)]
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'thetogetherblog.settings')
+    django.setup()
+
+
+@contextmanager
+def test_database():
+    from django.db import connection
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def words(count):
+    return ' '.join(_random.choice(WORDS) for _ in range(count))
+
+
+def seed_posts(total, albums=0):
+    from api.models import Album, Post
+    album_ids = [str(uuid.uuid4()) for _ in range(albums)]
+    Album.objects.bulk_create(
+        [Album(id=album_id, title=words(3), description=words(20))
+         for album_id in album_ids], batch_size=BATCH_SIZE)
+    existing = Post.objects.count()
+    for start in range(existing, total, BATCH_SIZE):
+        Post.objects.bulk_create([
+            Post(id=str(uuid.uuid4()),
+                 title=words(4),
+                 content=words(60),
+                 album_id=album_ids[i % albums] if albums else None)
+            for i in range(start, min(start + BATCH_SIZE, total))
+        ], batch_size=BATCH_SIZE)
+
+
+def seed_albums(total):
+    from api.models import Album
+    existing = Album.objects.count()
+    for start in range(existing, total, BATCH_SIZE):
+        Album.objects.bulk_create([
+            Album(id=str(uuid.uuid4()),
+                  title=words(3),
+                  description=words(20),
+                  reference=words(1))
+            for _ in range(start, min(start + BATCH_SIZE, total))
+        ], batch_size=BATCH_SIZE)
+
+
+def timed(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        "p50": statistics.median(samples),
+        "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "p99": samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+    }
@@ -0,0 +1,57 @@
+"""
+Gunicorn configuration for the production entry point (see start.sh).
+
+Every setting can be overridden with a GUNICORN_* environment variable.
+Send SIGHUP to the master process for a graceful reload: new workers are
+started with the new code and old ones finish their requests first.
+"""
+
+import math
+import os
+
+
+def available_cpus():
+    # Respect the container CPU quota (cgroup v2, then v1) rather than the
+    # number of host CPUs, which os.cpu_count() reports inside containers.
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            return max(1, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    try:
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:
+            quota = int(f.read())
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+            period = int(f.read())
+        if quota > 0:
+            return max(1, math.ceil(quota / period))
+    except (OSError, ValueError):
+        pass
+    return len(os.sched_getaffinity(0))
+
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', available_cpus() * 2 + 1))
+# The response cache and the session cache default to locmem, which every
+# worker keeps for itself: a write would only invalidate the cache of the
+# worker that handled it. Workers are forked from this process after the
+# config is read, so they all start with these settings.
+if workers > 1:
+    os.environ.setdefault('API_CACHE_BACKEND', 'file')
+    os.environ.setdefault('SESSION_CACHE_BACKEND', 'file')
+# Sync workers close the connection after every response, gthread workers
+# honour keep-alive.
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 2))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+# Recycle workers after a number of requests to bound memory growth. The
+# jitter keeps workers from restarting all at once.
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '') == '1'
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-') or None
+errorlog = '-'
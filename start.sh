@@ -1,11 +1,26 @@
 #!/bin/sh
 
-python manage.py makemigrations api
-python manage.py migrate
+# Every start applies pending migrations and creates the superuser first.
+# Once the schema is up to date this is only a migration plan check, and
+# concurrent replicas serialize on an advisory lock. Deployments that run
+# the one-shot bootstrap (./start.sh bootstrap) as a release step can skip
+# it with BOOTSTRAP_ON_START=0.
+if [ "$1" = "bootstrap" ]; then
+    exec python manage.py bootstrap
+fi
 
-DJANGO_SUPERUSER_PASSWORD=${SU_PASSWORD} \
-DJANGO_SUPERUSER_USERNAME=${SU_ADMIN} \
-DJANGO_SUPERUSER_EMAIL=${SU_EMAIL} \
-python manage.py createsuperuser \
---no-input
-python manage.py runserver 0.0.0.0:8000
\ No newline at end of file
+if [ "${BOOTSTRAP_ON_START:-1}" != "0" ]; then
+    python manage.py bootstrap || exit 1
+fi
+
+if [ "${SERVER}" = "runserver" ]; then
+    exec python manage.py runserver 0.0.0.0:8000
+fi
+# SERVER=asgi serves the async read views with uvicorn workers. Django opens
+# a connection per ASGI request, so persistent connections are off there.
+if [ "${SERVER}" = "asgi" ]; then
+    export DB_CONN_MAX_AGE="${DB_CONN_MAX_AGE:-0}"
+    exec gunicorn thetogetherblog.asgi:application --config gunicorn.conf.py \
+        --worker-class uvicorn_worker.UvicornWorker
+fi
+exec gunicorn thetogetherblog.wsgi:application --config gunicorn.conf.py
@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/3.1/ref/settings/
 from pathlib import Path
 import os
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -21,7 +23,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # See https://docs.djangoproject.com/en/3.1/howto/deployment/checklist/
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = '(0x$583=_h5@jud290me24^)j99_mc%lluedr43p@wnlo0!%e9'
+SECRET_KEY = os.environ.get('SECRET_KEY', '(0x$583=_h5@jud290me24^)j99_mc%lluedr43p@wnlo0!%e9')
 
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = False
@@ -32,7 +34,7 @@ ALLOWED_HOSTS = ["*"]
 # Application definition
 
 INSTALLED_APPS = [
-    'api',
+    'api.apps.ApiConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -43,12 +45,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware', #add whitenoise
+    'api.middleware.AsyncWhiteNoiseMiddleware', #add whitenoise
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.middleware.TokenAuthenticationMiddleware',
+    'api.middleware.ProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -78,6 +83,11 @@ WSGI_APPLICATION = 'thetogetherblog.wsgi.application'
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
 
 
+# Seconds a connection is reused across requests before it is closed, 0 to
+# close it after every request. Each environment has its own default and
+# DB_CONN_MAX_AGE overrides it.
+DB_CONN_MAX_AGE = 60
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql_psycopg2',
@@ -90,6 +100,7 @@ DATABASES = {
 }
 
 if os.environ.get('DEPLOY'):
+    DB_CONN_MAX_AGE = 600
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.postgresql_psycopg2',
@@ -102,6 +113,7 @@ if os.environ.get('DEPLOY'):
     }
 
 if os.environ.get('GITHUB_WORKFLOW'):
+    DB_CONN_MAX_AGE = 0
     DATABASES = {
         'default': {
            'ENGINE': 'django.db.backends.postgresql',
@@ -113,6 +125,139 @@ if os.environ.get('GITHUB_WORKFLOW'):
         }
     }
 
+# Persistent connections are checked before reuse, so a connection dropped
+# by the server or a failover is replaced instead of failing the request.
+# With DB_POOLER=transaction the connections go to a transaction pooling
+# pgbouncer, which cannot keep server-side cursors across transactions.
+DATABASES['default'].update({
+    'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', DB_CONN_MAX_AGE)),
+    'CONN_HEALTH_CHECKS': True,
+    'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('DB_POOLER') == 'transaction',
+})
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+#
+# The read endpoints cache their responses in the API_CACHE_ALIAS cache.
+# API_CACHE_BACKEND selects locmem (per process, the default), file (shared
+# by every process on the host, stored in API_CACHE_LOCATION) or dummy.
+
+API_CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'dummy': 'django.core.cache.backends.dummy.DummyCache',
+}
+
+API_CACHE_BACKEND = os.environ.get('API_CACHE_BACKEND', 'locmem')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'api': {
+        'BACKEND': API_CACHE_BACKENDS[API_CACHE_BACKEND],
+        'LOCATION': os.environ.get('API_CACHE_LOCATION',
+                                   os.path.join(BASE_DIR, 'cache') if API_CACHE_BACKEND == 'file' else 'api'),
+        'TIMEOUT': int(os.environ.get('API_CACHE_TIMEOUT', 300)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('API_CACHE_MAX_ENTRIES', 1000)),
+        },
+    },
+}
+
+API_CACHE_ALIAS = 'api'
+
+
+# /api/sync/ returns changes up to API_SYNC_LAG seconds ago. A change is
+# missed only if its transaction commits, or the clock of the app server
+# that stamped it is behind, by more than that.
+
+API_SYNC_LAG = int(os.environ.get('API_SYNC_LAG', 5))
+
+
+# Async views
+#
+# thetogetherblog/asgi.py turns ASYNC_VIEWS on, which routes the read
+# endpoints to the coroutine views in api/async_views.py. Under WSGI they
+# stay on the sync views, which would otherwise need an event loop per
+# request.
+
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS') == '1'
+
+
+# JSON encoder for API responses, "orjson" or "json". Empty picks orjson
+# when it is installed. See api/responses.py.
+
+API_JSON_ENCODER = os.environ.get('API_JSON_ENCODER', '')
+
+
+# Sessions and API tokens
+#
+# SESSION_BACKEND selects where login sessions are kept: db (the default),
+# cached_db (db, read through the sessions cache), cache (the sessions cache
+# only, which every process must share, e.g. SESSION_CACHE_BACKEND=file) or
+# signed_cookies (the cookie itself, nothing is stored on the server).
+#
+# /api/login/ with "token": true returns a signed bearer token instead of
+# starting a session. api.middleware.TokenAuthenticationMiddleware checks it
+# without touching the database, and it expires after API_TOKEN_MAX_AGE
+# seconds. Signed cookies and tokens can be forged with SECRET_KEY, so a
+# deployment only allows them with its own SECRET_KEY.
+
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'db')
+SESSION_ENGINE = SESSION_ENGINES[SESSION_BACKEND]
+
+SESSION_CACHE_BACKEND = os.environ.get('SESSION_CACHE_BACKEND', 'locmem')
+SESSION_CACHE_ALIAS = 'sessions'
+CACHES[SESSION_CACHE_ALIAS] = {
+    'BACKEND': API_CACHE_BACKENDS[SESSION_CACHE_BACKEND],
+    'LOCATION': os.environ.get('SESSION_CACHE_LOCATION',
+                               os.path.join(BASE_DIR, 'cache', 'sessions')
+                               if SESSION_CACHE_BACKEND == 'file' else 'sessions'),
+    'OPTIONS': {
+        'MAX_ENTRIES': int(os.environ.get('SESSION_CACHE_MAX_ENTRIES', 10000)),
+    },
+}
+
+API_TOKENS = not os.environ.get('DEPLOY') or 'SECRET_KEY' in os.environ
+API_TOKEN_MAX_AGE = int(os.environ.get('API_TOKEN_MAX_AGE', 24 * 60 * 60))
+
+if SESSION_BACKEND == 'signed_cookies' and not API_TOKENS:
+    raise ImproperlyConfigured("SESSION_BACKEND=signed_cookies needs SECRET_KEY to be set")
+
+
+# Metrics
+#
+# api.middleware.MetricsMiddleware records per view timings and query counts,
+# served to staff at /api/metrics/. Requests slower than API_SLOW_REQUEST_MS
+# milliseconds or running at least API_SLOW_REQUEST_QUERIES queries are
+# logged with their SQL to the api.metrics logger, 0 turns a threshold off.
+
+API_METRICS = os.environ.get('API_METRICS', '1') == '1'
+API_SLOW_REQUEST_MS = int(os.environ.get('API_SLOW_REQUEST_MS', 0))
+API_SLOW_REQUEST_QUERIES = int(os.environ.get('API_SLOW_REQUEST_QUERIES', 0))
+
+
+# Profiler
+#
+# With API_PROFILER=1, api.middleware.ProfilerMiddleware profiles staff
+# requests that send "X-Profile: 1" and API_PROFILER_SAMPLE_RATE (0 to 1)
+# of all requests. Profiles are written to API_PROFILER_DIR, which keeps the
+# newest API_PROFILER_MAX_FILES, and staff download them from /api/profiles/.
+
+API_PROFILER = os.environ.get('API_PROFILER') == '1'
+API_PROFILER_SAMPLE_RATE = float(os.environ.get('API_PROFILER_SAMPLE_RATE', 0))
+API_PROFILER_DIR = os.environ.get('API_PROFILER_DIR', os.path.join(BASE_DIR, 'profiles'))
+API_PROFILER_MAX_FILES = int(os.environ.get('API_PROFILER_MAX_FILES', 100))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -0,0 +1,14 @@
+"""
+Settings for the test suite, used by manage.py test unless
+DJANGO_SETTINGS_MODULE is set.
+
+The tests create users and log in all the time, and the default PBKDF2
+hasher makes each of those take a large part of a second on purpose. MD5
+is insecure but fast, which is all a throwaway test database needs.
+"""
+
+from .settings import *  # noqa: F401,F403
+
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.MD5PasswordHasher',
+]